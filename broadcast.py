@@ -0,0 +1,35 @@
+import asyncio
+
+#
+# In-process publish/subscribe hub
+#
+# The control loop publishes one frame per tick and every WebSocket client
+# reads from its own bounded queue. When a slow client's queue is full the
+# oldest frame is dropped, so publish() never blocks or slows the publisher.
+#
+class BroadcastHub:
+    def __init__(self, max_queue_size=32):
+        self.max_queue_size = max_queue_size
+        self.subscribers = set()
+        self.dropped_frames = 0
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    # Fan a message out to every subscriber without awaiting anything
+    def publish(self, message):
+        for queue in self.subscribers:
+            if queue.full():
+                # Drop the stalest frame to make room for the newest one
+                queue.get_nowait()
+                self.dropped_frames += 1
+            queue.put_nowait(message)
+
+    @property
+    def subscriber_count(self):
+        return len(self.subscribers)
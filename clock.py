@@ -0,0 +1,78 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+#
+# Clocks
+#
+# Everything that measures roast time (the simulator, the control loop and
+# the roast log) reads it from one shared clock, so simulated runs can go at
+# real speed, sped up, or as fast as the CPU allows.
+#
+#   RealClock     monotonic wall time
+#   ScaledClock   simulated seconds pass `factor` times faster than real ones
+#   VirtualClock  time only moves when someone sleeps or calls advance(), so
+#                 runs are deterministic and bit-for-bit reproducible
+#
+# now() returns seconds; sleep() is awaited with a duration in clock seconds.
+#
+class RealClock:
+    def now(self):
+        return time.monotonic()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(max(0, seconds))
+
+class ScaledClock:
+    def __init__(self, factor):
+        self.factor = factor
+        self._origin = time.monotonic()
+
+    def now(self):
+        return (time.monotonic() - self._origin) * self.factor
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(max(0, seconds) / self.factor)
+
+# With auto_advance (the default) sleep() jumps time forward immediately and
+# only yields to the event loop, so a single control loop runs flat out.
+# Without it sleepers wait until a driver calls advance() past their deadline.
+class VirtualClock:
+    def __init__(self, start=0.0, auto_advance=True):
+        self._now = start
+        self.auto_advance = auto_advance
+        self._sleepers = []
+        self._sequence = itertools.count()
+
+    def now(self):
+        return self._now
+
+    async def sleep(self, seconds):
+        deadline = self._now + max(0, seconds)
+        if self.auto_advance:
+            self._now = max(self._now, deadline)
+            await asyncio.sleep(0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (deadline, next(self._sequence), future))
+        await future
+
+    # Move time forward, waking every sleeper whose deadline has passed
+    def advance(self, seconds):
+        self._now += seconds
+        while self._sleepers and self._sleepers[0][0] <= self._now:
+            _, _, future = heapq.heappop(self._sleepers)
+            if not future.done():
+                future.set_result(None)
+
+CLOCKS = ("real", "scaled", "virtual")
+
+def make_clock(kind, factor=1):
+    if kind == "real":
+        return RealClock()
+    if kind == "scaled":
+        return ScaledClock(factor)
+    if kind == "virtual":
+        return VirtualClock()
+    raise ValueError(f"Unknown clock '{kind}', expected one of {', '.join(CLOCKS)}")
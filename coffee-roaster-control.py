@@ -1,329 +1,489 @@
 # main.py
-from fastapi import FastAPI, WebSocket, HTTPException
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
-from typing import List, Dict
+from startup_timing import STARTUP_SORT_KEYS, timeline  # first, so every later import is timed
+from fastapi import APIRouter, Depends, FastAPI, WebSocket, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse
+from typing import Dict, Optional
+from contextlib import asynccontextmanager
 import asyncio
-import json
-from datetime import datetime
-import csv
+import importlib
 import os
-import numpy as np
-from scipy.interpolate import CubicSpline
-import math
-import time
-
-app = FastAPI()
-
-# Placeholder for actual hardware integration
+from clock import make_clock
+from roaster_sim import SimulatedRoaster, load_thermal_params
+from roast_log import read_log
+from profile_store import ProfileStore
+from roast_catalog import SORTABLE_COLUMNS, RoastCatalog
+from downsample import DOWNSAMPLE_METHODS, downsample_indices, time_range
+from scheduler import scheduler
+from telemetry_codec import TelemetryEncoder
+from roast_settings import SPLINE_MODULE, RoastSettings
+from roaster_session import DEFAULT_ROASTER, RoasterSession, SessionManager
+from metrics import PROFILE_SORT_KEYS, profile_event_loop, registry, sample_stacks
+from static_assets import StaticAsset
+from sensor_acquisition import SensorAcquisition
+
+timeline.mark("imports")
+
+# Startup and shutdown; the startup steps are defined further down
+@asynccontextmanager
+async def lifespan(app):
+    await start_control_loops()
+    warm_spline_module()
+    sync_catalog()
+    yield
+    sessions.stop_all()
+    await profile_store.flush()
+
+app = FastAPI(lifespan=lifespan)
+
+# Placeholder for actual hardware integration. The thermocouples are sampled
+# and filtered on a background thread (see sensor_acquisition.py); the control
+# loop only picks up the latest filtered values.
 class RoasterHardware:
-    def read_temperature(self):
-        pass
+    def __init__(self, roaster_id=DEFAULT_ROASTER):
+        self.sensors = SensorAcquisition(roaster_id, self.read_thermocouples)
 
-    def set_fan_speed(self, speed):
-        pass
+    # Open the sensor and actuator buses and start sampling; called once the
+    # server is starting
+    def open(self):
+        self.sensors.start()
 
-    def set_heating_element(self, power):
+    # One raw (bean, environment) sample from the thermocouple amplifiers
+    def read_thermocouples(self):
         pass
 
-# Simulated roaster
-class SimulatedRoaster:
-    def __init__(self, heating_lag=5.0, speed_up_factor=5):
-        self.bean_temperature = 25.0
-        self.env_temperature = 25.0
-        self.fan_speed = 0.0
-        self.heating_power = 0.0
-        self.current_heating_power = 0.0
-        self.ambient_temperature = 25.0
-        self.max_cooling_rate = 5.0
-        self.heating_efficiency = 10.0
-        self.heating_lag = heating_lag
-        self.speed_up_factor = speed_up_factor
-        self.last_update_time = time.time()
-
+    # Latest filtered (bean, environment) temperatures; raises
+    # StaleReadingError when they can't be trusted
     def read_temperatures(self):
-        current_time = time.time()
-        elapsed_time = (current_time - self.last_update_time) * self.speed_up_factor
-        self.last_update_time = current_time
-
-        # Update current heating power based on lag
-        heating_power_difference = self.heating_power - self.current_heating_power
-        self.current_heating_power += heating_power_difference * elapsed_time / self.heating_lag
-
-        # Calculate heating effect
-        heating_effect = self.current_heating_power * self.heating_efficiency * elapsed_time
-        
-        # Calculate cooling effect
-        env_temperature_difference = self.env_temperature - self.ambient_temperature
-        env_cooling_factor = math.exp(env_temperature_difference / 100) - 1
-        env_cooling_effect = min(self.max_cooling_rate, env_cooling_factor * (1 + self.fan_speed)) * elapsed_time
-        
-        # Update environment temperature
-        self.env_temperature += heating_effect - env_cooling_effect
-        
-        # Update bean temperature (lags behind environment temperature)
-        bean_temperature_difference = self.env_temperature - self.bean_temperature
-        bean_heating_effect = bean_temperature_difference * 0.1 * elapsed_time
-        self.bean_temperature += bean_heating_effect
-        
-        # Ensure temperatures don't go below ambient
-        self.env_temperature = max(self.env_temperature, self.ambient_temperature)
-        self.bean_temperature = max(self.bean_temperature, self.ambient_temperature)
-        
-        return self.bean_temperature, self.env_temperature
+        return self.sensors.read_temperatures()
 
     def set_fan_speed(self, speed):
-        self.fan_speed = max(0, min(1, speed))
+        pass
 
     def set_heating_element(self, power):
-        self.heating_power = max(0, min(1, power))
+        pass
 
 # Choose between simulated and real hardware
 USE_SIMULATION = True
 SPEED_UP_FACTOR = 5  # Simulation runs 5x faster than real time
 
-roaster = SimulatedRoaster(heating_lag=3.0, speed_up_factor=SPEED_UP_FACTOR) if USE_SIMULATION else RoasterHardware()
-
-class SetPoint(BaseModel):
-    time: float
-    temperature: float
-
-class RoastSettings(BaseModel):
-    setpoints: List[SetPoint]
-
-    def get_target_temperature(self, current_time):
-        if not self.setpoints:
-            raise ValueError("No setpoints defined. Cannot calculate target temperature.")
-        
-        times = [sp.time for sp in self.setpoints]
-        temperatures = [sp.temperature for sp in self.setpoints]
-        
-        if len(self.setpoints) == 1:
-            # If there's only one setpoint, return its temperature
-            return float(temperatures[0])
-        
-        cs = CubicSpline(times, temperatures)
-        return float(cs(current_time))
-
-roast_settings = RoastSettings(setpoints=[SetPoint(time=0.0, temperature=200.0)])
-is_roasting = False
-roast_data = []
+# Roast time comes from one clock shared by the simulators, control loops and
+# roast logs. ROASTER_CLOCK=virtual runs simulated roasts as fast as the CPU
+# allows (for tests; the control loop never idles on a virtual clock).
+CLOCK = os.environ.get("ROASTER_CLOCK", "scaled" if USE_SIMULATION else "real")
+clock = make_clock(CLOCK, SPEED_UP_FACTOR)
+
+# One session per roaster this process drives, e.g. ROASTERS=default,drum2.
+# Every roaster endpoint is served under /roasters/<id>/...; the original
+# paths without a roaster ID act on the "default" roaster.
+ROASTER_IDS = [roaster_id.strip() for roaster_id in os.environ.get("ROASTERS", DEFAULT_ROASTER).split(",") if roaster_id.strip()]
+
+# Simulated roasters use the parameters system_id.py fitted to that roaster's
+# logs when <SIM_PARAMS_DIR>/<id>.json exists
+SIM_PARAMS_DIR = os.environ.get("ROASTER_SIM_PARAMS", "sim_params")
+
+def make_roaster(roaster_id):
+    if not USE_SIMULATION:
+        return RoasterHardware(roaster_id)
+    params = {"heating_lag": 3.0}
+    params_path = os.path.join(SIM_PARAMS_DIR, f"{roaster_id}.json")
+    if os.path.exists(params_path):
+        try:
+            params.update(load_thermal_params(params_path))
+        except (OSError, ValueError) as e:
+            print(f"Ignoring simulator parameters in {params_path}: {e}")
+    return SimulatedRoaster(clock=clock, **params)
 
 roast_logs_dir = "roast_logs"
 os.makedirs(roast_logs_dir, exist_ok=True)
+catalog = RoastCatalog(roast_logs_dir)
+
+def catalog_log(filename):
+    try:
+        catalog.add(filename)
+    except Exception as e:
+        print(f"Unable to catalog {filename}: {e}")
+
+sessions = SessionManager()
+for roaster_id in ROASTER_IDS:
+    sessions.add(RoasterSession(roaster_id, make_roaster(roaster_id), clock, roast_logs_dir, clock_kind=CLOCK, on_log_saved=catalog_log))
+timeline.mark("sessions")
+
+# WebSocket timings, served at /metrics alongside each session's control loop timings
+encode_timer = registry.histogram("roaster_ws_encode_seconds", "Time to encode one message for a client")
+send_timer = registry.histogram("roaster_ws_send_seconds", "Time to send a client the frames for one message")
+registry.gauge("roaster_ws_clients", "Connected WebSocket clients", lambda: sum(session.hub.subscriber_count for session in sessions))
+registry.gauge("roaster_ws_dropped_frames", "Frames dropped for slow clients", lambda: sum(session.hub.dropped_frames for session in sessions))
 
 # New: Path for storing roast profiles
 PROFILES_FILE = "roast_profiles.json"
+# Debounce profile writes so a burst of edits costs one disk write
+PROFILES_WRITE_DELAY = 0.5
 
-# New: Load profiles from file
-def load_profiles():
-    if os.path.exists(PROFILES_FILE):
-        with open(PROFILES_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+profile_store = ProfileStore(PROFILES_FILE, write_delay=PROFILES_WRITE_DELAY)
 
-# New: Save profiles to file
-def save_profiles(profiles):
-    with open(PROFILES_FILE, 'w') as f:
-        json.dump(profiles, f, indent=2)
+# The UI page is served from memory, precompressed and revalidated with
+# ETag/Last-Modified; DEV_MODE=1 reloads it whenever the file changes
+DEV_MODE = os.environ.get("DEV_MODE", "") not in ("", "0")
+interface_page = StaticAsset("coffee-roaster-interface.html", "text/html; charset=utf-8", reload=DEV_MODE)
 
 @app.get("/")
-async def get():
-    with open("coffee-roaster-interface.html", "r") as file:
-        return HTMLResponse(content=file.read())
-
-# Add these new global variables
-is_preheating = False
-preheat_target_temperature = 0
-is_roast_completed = False
-
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    global is_roasting, is_preheating, roast_start_time, preheat_target_temperature, is_roast_completed
+async def get(request: Request):
+    return interface_page.response(request)
+
+# Hardware is opened when the server starts rather than at import, retrying
+# while the buses come back after a power cut
+HARDWARE_OPEN_ATTEMPTS = 10
+HARDWARE_RETRY_DELAY = 0.5
+
+async def open_hardware(roaster):
+    loop = asyncio.get_running_loop()
+    for attempt in range(1, HARDWARE_OPEN_ATTEMPTS + 1):
+        try:
+            return await loop.run_in_executor(None, roaster.open)
+        except Exception as e:
+            if attempt == HARDWARE_OPEN_ATTEMPTS:
+                raise
+            print(f"Unable to open roaster hardware ({e}), retrying ({attempt}/{HARDWARE_OPEN_ATTEMPTS})")
+            await asyncio.sleep(HARDWARE_RETRY_DELAY)
+
+async def start_control_loops():
+    for session in sessions:
+        if not session.simulated:
+            await open_hardware(session.roaster)
+    timeline.mark("hardware")
+    sessions.start_all()
+    timeline.ready()
+
+# The spline module is imported on first use; load it now, off the critical
+# path, and say so at once if it can't be (roasts can't start without it)
+def report_spline_warm_up(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Unable to import {SPLINE_MODULE}, roasts will fail to start: {future.exception()!r}")
+
+def warm_spline_module():
+    warm_up = asyncio.get_running_loop().run_in_executor(None, importlib.import_module, SPLINE_MODULE)
+    warm_up.add_done_callback(report_spline_warm_up)
+
+def report_catalog_sync(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Unable to sync the roast catalog, older logs may be missing from it: {future.exception()!r}")
+
+# Index any logs the catalog missed (e.g. written before a crash)
+def sync_catalog():
+    syncing = asyncio.get_running_loop().run_in_executor(None, catalog.sync)
+    syncing.add_done_callback(report_catalog_sync)
+
+@app.get("/roasters")
+async def get_roasters():
+    return {"roasters": [session.status for session in sessions]}
+
+#
+# Per-roaster routes. The router is mounted twice: under
+# /roasters/{roaster_id} and, for existing clients, at the root, where the
+# roaster ID defaults to DEFAULT_ROASTER (or can be given as ?roaster_id=).
+#
+roaster_router = APIRouter()
+
+def get_session(roaster_id: str = DEFAULT_ROASTER):
+    session = sessions.get(roaster_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown roaster '{roaster_id}'")
+    return session
+
+# Longest a partial batch waits for more samples, in real seconds
+BATCH_MAX_DELAY = 1.0
+
+async def send_frames(websocket: WebSocket, frames):
+    for frame in frames:
+        if isinstance(frame, bytes):
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_text(frame)
+
+# Forward frames from a hub subscription to one client
+async def forward_frames(websocket: WebSocket, queue: asyncio.Queue, encoder: TelemetryEncoder):
+    while True:
+        try:
+            message = await asyncio.wait_for(queue.get(), BATCH_MAX_DELAY if encoder.pending else None)
+            with encode_timer.time():
+                frames = encoder.encode(message)
+        except asyncio.TimeoutError:
+            frames = encoder.flush()
+        with send_timer.time():
+            await send_frames(websocket, frames)
+
+# ?format=json|binary|msgpack picks the frame encoding and ?batch=N sends up
+# to N samples per frame; see telemetry_codec.py. Plain /ws is one JSON
+# object per sample. Every sample carries a sequence number; connecting with
+# ?since=<seq> (or ?since=-1 for everything) first replays the buffered
+# samples of the current roast after that one.
+@roaster_router.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket, roaster_id: str = DEFAULT_ROASTER, format: str = "json",
+                             batch: int = 1, since: Optional[int] = None):
+    session = sessions.get(roaster_id)
+    try:
+        if session is None:
+            raise ValueError(f"Unknown roaster '{roaster_id}'")
+        encoder = TelemetryEncoder(format, batch)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
     await websocket.accept()
+    # Subscribing and snapshotting the buffer without awaiting in between
+    # means the backfill and the live frames neither overlap nor leave a gap
+    queue = session.hub.subscribe()
+    backfill = []
+    if since is not None:
+        seqs, columns = session.telemetry_buffer.since(since)
+        backfill = encoder.encode_backfill(seqs, columns, dict(session.event_detector.events))
+    # A client joining during a sensor fault learns why there are no samples
+    if session.sensor_fault is not None:
+        backfill += encoder.encode({"sensor_fault": session.sensor_fault})
+    try:
+        await send_frames(websocket, backfill)
+    except Exception as e:
+        print(f"WebSocket error: {e}")
+        session.hub.unsubscribe(queue)
+        return
+    sender = asyncio.create_task(forward_frames(websocket, queue, encoder))
     try:
-        while True:
-            if is_roasting or is_preheating:
-                current_time = (datetime.now() - roast_start_time).total_seconds() if is_roasting else 0
-                if USE_SIMULATION:
-                    current_time *= SPEED_UP_FACTOR
-                bean_temperature, env_temperature = roaster.read_temperatures()
-                
-                if is_roasting:
-                    target_temperature = roast_settings.get_target_temperature(current_time)
-                else:  # is_preheating
-                    target_temperature = preheat_target_temperature
-                
-                # Simple PID-like control (you might want to adjust this for two temperatures)
-                error = target_temperature - bean_temperature
-                fan_speed = max(0, min(1, 0.5 - error * 0.02))
-                heating_power = max(0, min(1, error * 0.05))
-                
-                roaster.set_fan_speed(fan_speed)
-                roaster.set_heating_element(heating_power)
-                
-                if is_roasting:
-                    roast_data.append([datetime.now().isoformat(), bean_temperature, env_temperature, fan_speed, heating_power])
-                
-                await websocket.send_json({
-                    "time": current_time,
-                    "bean_temperature": bean_temperature,
-                    "env_temperature": env_temperature,
-                    "target_temperature": target_temperature,
-                    "fan_speed": fan_speed,
-                    "heating_power": heating_power,
-                    "is_preheating": is_preheating,
-                    "is_roasting": is_roasting,
-                    "is_roast_completed": is_roast_completed
-                })
-                
-                # Check if the roast should end (only if we're actually roasting)
-                if is_roasting and current_time >= roast_settings.setpoints[-1].time and bean_temperature >= target_temperature:
-                    is_roasting = False
-                    is_roast_completed = True
-                    save_roast_data()
-                    await websocket.send_json({"roast_finished": True})
-            
-            await asyncio.sleep(1 / SPEED_UP_FACTOR if USE_SIMULATION else 1)
+        # Clients never send anything; receiving only detects the disconnect
+        # so idle subscriptions don't linger between roasts.
+        while not sender.done():
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
-        await websocket.close()
-
-@app.post("/start_preheat")
-async def start_preheat():
-    global is_preheating, preheat_target_temperature, roast_settings, is_roast_completed
-    if is_roasting:
-        return {"message": "Cannot start preheating while roasting"}
-    
-    # Get the first setpoint temperature
-    first_setpoint = roast_settings.setpoints[0] if roast_settings.setpoints else None
-    if not first_setpoint:
-        return {"message": "No setpoints defined"}
-    
-    preheat_target_temperature = first_setpoint.temperature
-    is_preheating = True
-    is_roast_completed = False
-    return {"message": f"Preheating started to {preheat_target_temperature}°C"}
-
-@app.post("/start_roast")
-async def start_roast(settings: RoastSettings):
-    global roast_settings, is_roasting, is_preheating, roast_data, roast_start_time
-    if is_roasting:
-        return {"message": "A roast is already in progress"}
-    if not is_preheating:
-        return {"message": "Please preheat before starting the roast"}
-    roast_settings = settings
-    is_roasting = True
-    is_preheating = False
-    roast_data = []
-    roast_start_time = datetime.now()
-    
-    # Generate the entire roast profile
-    total_time = settings.setpoints[-1].time
-    time_points = np.linspace(0, total_time, num=int(total_time)+1)
-    target_temperatures = [settings.get_target_temperature(t) for t in time_points]
-    
-    return {
-        "message": "Roast started",
-        "profile": {
-            "time": time_points.tolist(),
-            "target_temperature": target_temperatures
-        }
-    }
-
-@app.get("/stop_roast")
-async def stop_roast():
-    global is_roasting, is_roast_completed
-    if not is_roasting:
-        return {"message": "No roast in progress"}
-    is_roasting = False
-    is_roast_completed = True
-    save_roast_data()
-    return {"message": "Roast stopped"}
-
-@app.get("/reset_roast")
-async def reset_roast():
-    global is_roasting, is_preheating, is_roast_completed
-    is_roasting = False
-    is_preheating = False
-    is_roast_completed = False
-    return {"message": "Roast reset, ready for preheating"}
-
-def save_roast_data():
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"roast_log_{timestamp}.csv"
-    
-    with open(filename, 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['Time', 'Bean_Temperature', 'Environment_Temperature', 'Fan_Speed', 'Heating_Power', 'Target_Temperature'])
-        
-        for row in roast_data:
-            time = (datetime.fromisoformat(row[0]) - roast_start_time).total_seconds()
-            if USE_SIMULATION:
-                time *= SPEED_UP_FACTOR
-            target_temp = get_target_temperature(time, roast_settings.setpoints)
-            writer.writerow(row + [target_temp])
-    
-    print(f"Roast data saved to {filename}")
-
-def get_target_temperature(time, setpoints):
-    for i in range(len(setpoints) - 1):
-        if setpoints[i].time <= time < setpoints[i+1].time:
-            t1, t2 = setpoints[i].time, setpoints[i+1].time
-            temp1, temp2 = setpoints[i].temperature, setpoints[i+1].temperature
-            return temp1 + (temp2 - temp1) * (time - t1) / (t2 - t1)
-    return setpoints[-1].temperature  # Return last setpoint temperature if time is beyond all setpoints
-
+        sender.cancel()
+        session.hub.unsubscribe(queue)
+
+@roaster_router.get("/status")
+async def get_status(session: RoasterSession = Depends(get_session)):
+    return session.status
+
+# Latest filtered and raw thermocouple readings with their flags, plus the
+# last ?history=N samples; only roasters with real sensors have them
+@roaster_router.get("/sensors")
+async def get_sensors(history: int = 0, session: RoasterSession = Depends(get_session)):
+    sensors = getattr(session.roaster, "sensors", None)
+    if sensors is None:
+        raise HTTPException(status_code=404, detail=f"Roaster '{session.roaster_id}' has no sensor acquisition")
+    return sensors.report(history)
+
+@roaster_router.post("/start_preheat")
+async def start_preheat(session: RoasterSession = Depends(get_session)):
+    return session.start_preheat()
+
+@roaster_router.post("/start_roast")
+async def start_roast(settings: RoastSettings, session: RoasterSession = Depends(get_session)):
+    return session.start_roast(settings)
+
+@roaster_router.get("/stop_roast")
+async def stop_roast(session: RoasterSession = Depends(get_session)):
+    return session.stop_roast()
+
+@roaster_router.get("/reset_roast")
+async def reset_roast(session: RoasterSession = Depends(get_session)):
+    return session.reset_roast()
+
+@roaster_router.get("/controller")
+async def get_controller(session: RoasterSession = Depends(get_session)):
+    return session.controller.settings
+
+# Replace the active controller, e.g. {"kind": "pid", "kp": 0.04, "ki": 0.001}
+@roaster_router.post("/controller")
+async def set_controller(settings: Dict, session: RoasterSession = Depends(get_session)):
+    try:
+        return session.set_controller(settings)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Relay-autotune the PID gains around `setpoint`. Only allowed while idle;
+# poll GET /autotune for the result.
+@roaster_router.post("/autotune")
+async def start_autotune(setpoint: float = 200.0, apply: bool = True, session: RoasterSession = Depends(get_session)):
+    return session.start_autotune(setpoint, apply)
+
+@roaster_router.get("/autotune")
+async def get_autotune(session: RoasterSession = Depends(get_session)):
+    return {"running": session.autotuning, "result": session.autotune_result, "controller": session.controller.settings}
+
+app.include_router(roaster_router, prefix="/roasters/{roaster_id}")
+app.include_router(roaster_router)
+
+# Per-loop tick counts, overruns and lateness histograms
+@app.get("/debug/scheduler")
+async def get_scheduler_stats():
+    return scheduler.report()
+
+# Prometheus scrape target: control tick stage timings, WebSocket encode and
+# send times, Maestro round trips and scheduler lateness
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+PROFILE_MODES = ("cprofile", "sample")
+
+# Profile the running server for ?seconds=. mode=cprofile traces the event
+# loop (control loop and handlers); mode=sample samples every thread's stack.
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 5.0, mode: str = "cprofile", sort: str = "cumulative", limit: int = 40):
+    if not 0 < seconds <= 60:
+        raise HTTPException(status_code=400, detail="seconds must be between 0 and 60")
+    if mode not in PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode '{mode}', expected one of {', '.join(PROFILE_MODES)}")
+    if sort not in PROFILE_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort key '{sort}', expected one of {', '.join(PROFILE_SORT_KEYS)}")
+    if mode == "sample":
+        return PlainTextResponse(await sample_stacks(seconds, limit=limit))
+    try:
+        return PlainTextResponse(await profile_event_loop(seconds, sort, limit))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+# Time from process start to the control loops running, with a per-module
+# import breakdown (?sort=cumulative|self|order&limit=N)
+@app.get("/debug/startup")
+async def debug_startup(sort: str = "cumulative", limit: int = 30):
+    if sort not in STARTUP_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort key '{sort}', expected one of {', '.join(STARTUP_SORT_KEYS)}")
+    return timeline.report(sort, limit)
+
+# Lists cataloged roasts, newest first by default. Filter with ?profile=,
+# ?started_after=/?started_before= (ISO-8601) and ?min_duration=/?max_duration=
+# (seconds); sort with ?sort=<column>&order=asc|desc; page with ?limit=&offset=.
 @app.get("/roast_logs")
-async def get_roast_logs():
-    logs = [f for f in os.listdir(roast_logs_dir) if f.endswith('.csv')]
-    return {"logs": logs}
-
+async def get_roast_logs(
+    profile: Optional[str] = None,
+    started_after: Optional[str] = None,
+    started_before: Optional[str] = None,
+    min_duration: Optional[float] = None,
+    max_duration: Optional[float] = None,
+    sort: str = "started_at",
+    order: str = "desc",
+    limit: int = 100,
+    offset: int = 0,
+):
+    if sort not in SORTABLE_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by '{sort}'")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    if limit < 1 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be positive and offset non-negative")
+    total, roasts = catalog.query(
+        profile_name=profile,
+        started_after=started_after,
+        started_before=started_before,
+        min_duration=min_duration,
+        max_duration=max_duration,
+        sort=sort,
+        descending=order == "desc",
+        limit=limit,
+        offset=offset,
+    )
+    return {"logs": [roast["filename"] for roast in roasts], "roasts": roasts, "total": total}
+
+# Side-by-side summaries, e.g. /roast_logs/compare?filenames=a.csv,b.csv
+@app.get("/roast_logs/compare")
+async def compare_roast_logs(filenames: str):
+    return {"roasts": catalog.compare(filenames.split(","))}
+
+@app.get("/roast_summary/{filename}")
+async def get_roast_summary(filename: str):
+    summary = catalog.get(filename)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Roast not found in catalog")
+    return summary
+
+# Columns can be selected with ?columns=Time,Bean_Temperature and limited to
+# a time window with ?start=&end= (roast seconds). ?max_points=N returns a
+# shape-preserving downsample of at most about N rows, chosen on the `y`
+# column with ?method=lttb (default) or minmax; ?step=N simply keeps every
+# Nth row. Rows are returned by default; ?layout=columns returns one array per
+# column plus the log's profile and metadata.
 @app.get("/roast_log/{filename}")
-async def get_roast_log(filename: str):
+async def get_roast_log(
+    filename: str,
+    columns: Optional[str] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    max_points: Optional[int] = None,
+    method: str = "lttb",
+    y: str = "Bean_Temperature",
+    step: int = 1,
+    layout: str = "rows",
+):
     filepath = os.path.join(roast_logs_dir, filename)
     if not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="Log file not found")
-    with open(filepath, "r") as file:
-        reader = csv.DictReader(file)
-        data = list(reader)
-    return {"data": data}
+    if step < 1:
+        raise HTTPException(status_code=400, detail="step must be at least 1")
+    if max_points is not None and max_points < 3:
+        raise HTTPException(status_code=400, detail="max_points must be at least 3")
+    if method not in DOWNSAMPLE_METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(DOWNSAMPLE_METHODS)}")
+    if layout not in ("rows", "columns"):
+        raise HTTPException(status_code=400, detail="layout must be 'rows' or 'columns'")
+    
+    selected = columns.split(",") if columns else None
+    # Time and the downsampling column are always loaded, even if not returned
+    header, data = read_log(filepath, None if selected is None else set(selected) | {"Time", y})
+    if y not in data:
+        raise HTTPException(status_code=400, detail=f"Unknown column '{y}'")
+    
+    window = time_range(data["Time"], start, end)
+    data = {name: values[window] for name, values in data.items()}
+    if max_points is not None:
+        indices = downsample_indices(data["Time"], data[y], max_points, method)
+        data = {name: values[indices] for name, values in data.items()}
+    data = {
+        name: values[::step].tolist()
+        for name, values in data.items()
+        if selected is None or name in selected
+    }
+    if layout == "columns":
+        return {"columns": data, "profile": header.get("profile"), "metadata": header.get("metadata")}
+    names = list(data)
+    return {"data": [dict(zip(names, row)) for row in zip(*data.values())]}
 
 # New: Route to save a roast profile
 @app.post("/save_profile")
 async def save_profile(profile: Dict):
-    profiles = load_profiles()
     profile_name = profile.get('name')
     if not profile_name:
         raise HTTPException(status_code=400, detail="Profile name is required")
-    profiles[profile_name] = profile
-    save_profiles(profiles)
-    return {"message": f"Profile '{profile_name}' saved successfully"}
+    await profile_store.save(profile_name, profile)
+    return {"message": f"Profile '{profile_name}' saved successfully", "version": profile_store.version}
 
-# New: Route to get all saved profiles
+# New: Route to get all saved profiles. Clients can poll with If-None-Match
+# and get an empty 304 until a profile changes.
 @app.get("/get_profiles")
-async def get_profiles():
-    profiles = load_profiles()
-    return {"profiles": profiles}
+async def get_profiles(request: Request, response: Response):
+    etag = profile_store.etag
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return {"profiles": profile_store.all(), "version": profile_store.version}
 
 # New: Route to load a specific profile
 @app.get("/load_profile/{profile_name}")
-async def load_profile(profile_name: str):
-    profiles = load_profiles()
-    if profile_name not in profiles:
+async def load_profile(profile_name: str, response: Response):
+    profile = profile_store.get(profile_name)
+    if profile is None:
         raise HTTPException(status_code=404, detail="Profile not found")
-    return profiles[profile_name]
+    response.headers["ETag"] = profile_store.etag
+    return profile
 
 # New: Route to delete a profile
 @app.delete("/delete_profile/{profile_name}")
 async def delete_profile(profile_name: str):
-    profiles = load_profiles()
-    if profile_name not in profiles:
+    try:
+        await profile_store.delete(profile_name)
+    except KeyError:
         raise HTTPException(status_code=404, detail="Profile not found")
-    del profiles[profile_name]
-    save_profiles(profiles)
-    return {"message": f"Profile '{profile_name}' deleted successfully"}
+    return {"message": f"Profile '{profile_name}' deleted successfully", "version": profile_store.version}
 
 if __name__ == "__main__":
     import uvicorn
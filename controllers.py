@@ -0,0 +1,185 @@
+import math
+import numpy as np
+
+#
+# Roast controllers
+#
+# A controller turns the target and measured temperatures into fan speed and
+# heating power:
+#
+#   update(target, target_slope, bean, env, dt) -> (fan_speed, heating_power)
+#   reset()
+#
+# target_slope is the profile's rate of change in degrees/second (0 while
+# preheating). All arithmetic is NumPy-friendly, so a controller works on
+# scalars for the live roaster or on arrays for BatchRoasterSimulator.
+#
+
+# Fan runs at half speed on target and backs off as the beans fall behind
+def fan_schedule(error, fan_base=0.5, fan_gain=0.02):
+    return np.clip(fan_base - error * fan_gain, 0, 1)
+
+# The original proportional law
+class ProportionalController:
+    kind = "proportional"
+
+    def __init__(self, kp=0.05, fan_base=0.5, fan_gain=0.02):
+        self.kp = kp
+        self.fan_base = fan_base
+        self.fan_gain = fan_gain
+
+    def reset(self):
+        pass
+
+    def update(self, target, target_slope, bean_temperature, env_temperature, dt):
+        error = target - bean_temperature
+        return fan_schedule(error, self.fan_base, self.fan_gain), np.clip(error * self.kp, 0, 1)
+
+    @property
+    def settings(self):
+        return {"kind": self.kind, "kp": self.kp, "fan_base": self.fan_base, "fan_gain": self.fan_gain}
+
+#
+# PID on heating power
+#
+# - integral term clamped to integral_limit and frozen while the output is
+#   saturated in the direction the error pushes (conditional integration),
+#   so it can't wind up during preheat or when the element is maxed out
+# - derivative taken on the measurement, not the error, so setpoint steps
+#   don't kick the output, and low-pass filtered with time constant
+#   derivative_filter seconds to keep sensor noise out
+# - feed-forward adds feed_forward * target_slope, so the heater leads a
+#   rising profile instead of waiting for an error to build up
+#
+class PIDController:
+    kind = "pid"
+
+    def __init__(self, kp=0.05, ki=0.002, kd=0.1, feed_forward=0.5, derivative_filter=3.0,
+                 integral_limit=0.5, fan_base=0.5, fan_gain=0.02):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.feed_forward = feed_forward
+        self.derivative_filter = derivative_filter
+        self.integral_limit = integral_limit
+        self.fan_base = fan_base
+        self.fan_gain = fan_gain
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.derivative = 0.0
+        self.last_measurement = None
+
+    def update(self, target, target_slope, bean_temperature, env_temperature, dt):
+        error = target - bean_temperature
+
+        if self.last_measurement is None or dt <= 0:
+            measurement_rate = np.zeros_like(np.asarray(bean_temperature, dtype=np.float64))
+        else:
+            measurement_rate = (bean_temperature - self.last_measurement) / dt
+        self.last_measurement = bean_temperature
+        alpha = dt / (self.derivative_filter + dt) if dt > 0 else 0.0
+        self.derivative = self.derivative + alpha * (measurement_rate - self.derivative)
+
+        integral = np.clip(self.integral + self.ki * error * dt, -self.integral_limit, self.integral_limit)
+        unsaturated = self.kp * error + integral - self.kd * self.derivative + self.feed_forward * target_slope
+        heating_power = np.clip(unsaturated, 0, 1)
+
+        # Only keep integrating when that doesn't push further into saturation
+        winding_up = ((unsaturated > 1) & (error > 0)) | ((unsaturated < 0) & (error < 0))
+        self.integral = np.where(winding_up, self.integral, integral)
+
+        return fan_schedule(error, self.fan_base, self.fan_gain), heating_power
+
+    @property
+    def settings(self):
+        return {
+            "kind": self.kind,
+            "kp": self.kp,
+            "ki": self.ki,
+            "kd": self.kd,
+            "feed_forward": self.feed_forward,
+            "derivative_filter": self.derivative_filter,
+            "integral_limit": self.integral_limit,
+            "fan_base": self.fan_base,
+            "fan_gain": self.fan_gain,
+        }
+
+CONTROLLERS = {
+    ProportionalController.kind: ProportionalController,
+    PIDController.kind: PIDController,
+}
+
+def make_controller(kind="pid", **settings):
+    if kind not in CONTROLLERS:
+        raise ValueError(f"Unknown controller '{kind}', expected one of {', '.join(CONTROLLERS)}")
+    return CONTROLLERS[kind](**settings)
+
+#
+# Relay autotuner (Astrom-Hagglund)
+#
+# Switches the heater between relay_low and relay_high around `setpoint`
+# with a small hysteresis, which drives the roaster into a steady limit
+# cycle. The oscillation amplitude a and period Pu give the ultimate gain
+# Ku = 4d / (pi a), with d the relay half-swing, from which PID gains follow
+# via the Ziegler-Nichols "some overshoot" rule to avoid scorching beans.
+#
+# `roaster` needs read_temperatures(), set_heating_element() and
+# set_fan_speed(); `clock` is the clock the roaster runs on. With a
+# SimulatedRoaster on a VirtualClock a full tune takes milliseconds.
+#
+async def relay_autotune(roaster, clock, setpoint, relay_high=1.0, relay_low=0.0, hysteresis=1.0,
+                         fan_speed=0.5, cycles=4, sample_period=1.0, timeout=3600.0):
+    roaster.set_fan_speed(fan_speed)
+    heating = True
+    roaster.set_heating_element(relay_high)
+
+    start = clock.now()
+    switch_times = []  # times the relay switched on
+    peaks = []
+    troughs = []
+    extreme = None
+    try:
+        while len(switch_times) < cycles + 2:
+            if clock.now() - start > timeout:
+                raise TimeoutError(f"Autotune did not settle into {cycles} oscillations within {timeout} s")
+            bean_temperature, _ = roaster.read_temperatures()
+            if heating:
+                extreme = bean_temperature if extreme is None else max(extreme, bean_temperature)
+                if bean_temperature > setpoint + hysteresis:
+                    heating = False
+                    roaster.set_heating_element(relay_low)
+                    if switch_times:
+                        peaks.append(extreme)
+                    extreme = bean_temperature
+            else:
+                extreme = min(extreme, bean_temperature)
+                if bean_temperature < setpoint - hysteresis:
+                    heating = True
+                    roaster.set_heating_element(relay_high)
+                    switch_times.append(clock.now())
+                    if len(switch_times) > 1:
+                        troughs.append(extreme)
+                    extreme = bean_temperature
+            await clock.sleep(sample_period)
+    finally:
+        roaster.set_heating_element(0)
+
+    # The first cycle starts from ambient and is discarded
+    periods = np.diff(switch_times[1:])
+    amplitude = (np.mean(peaks[1:]) - np.mean(troughs[1:])) / 2
+    ultimate_period = float(np.mean(periods))
+    ultimate_gain = 4 * (relay_high - relay_low) / 2 / (math.pi * amplitude)
+
+    kp = 0.33 * ultimate_gain
+    ti = ultimate_period / 2
+    td = ultimate_period / 3
+    return {
+        "ultimate_gain": float(ultimate_gain),
+        "ultimate_period": ultimate_period,
+        "amplitude": float(amplitude),
+        "kp": float(kp),
+        "ki": float(kp / ti),
+        "kd": float(kp * td),
+    }
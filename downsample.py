@@ -0,0 +1,65 @@
+import numpy as np
+
+#
+# Shape-preserving downsampling for roast log series
+#
+# Both methods return sorted row indices so every column of a log can be
+# thinned with the same selection and rows stay aligned.
+#
+
+# Rows whose time falls in [start, end]; times must be ascending
+def time_range(times, start=None, end=None):
+    lo = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+    hi = len(times) if end is None else int(np.searchsorted(times, end, side='right'))
+    return slice(lo, max(lo, hi))
+
+# Largest-Triangle-Three-Buckets (Steinarsson, 2013). Buckets are walked in
+# order because each pick depends on the previous one; the work inside each
+# bucket is vectorized.
+def lttb_indices(x, y, max_points):
+    n = len(y)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # First and last points are always kept; the rest are split into
+    # max_points - 2 buckets
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.intp)
+    edges = np.append(edges, n)
+    selected = np.empty(max_points, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for bucket in range(max_points - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_start, next_stop = edges[bucket + 1], edges[bucket + 2]
+        avg_x = x[next_start:next_stop].mean()
+        avg_y = y[next_start:next_stop].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[bucket + 1] = a
+    return selected
+
+# Keep the minimum and maximum of each of max_points // 2 equal-count buckets.
+# Fully vectorized; cheaper than LTTB and never hides a spike.
+def minmax_indices(y, max_points):
+    n = len(y)
+    if max_points >= n or max_points < 2:
+        return np.arange(n)
+    buckets = max_points // 2
+    bucket_ids = np.arange(n) * buckets // n
+    order = np.lexsort((np.asarray(y), bucket_ids))
+    bucket_starts = np.searchsorted(bucket_ids[order], np.arange(buckets), side='left')
+    bucket_ends = np.append(bucket_starts[1:], n) - 1
+    return np.unique(np.concatenate((order[bucket_starts], order[bucket_ends])))
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+def downsample_indices(x, y, max_points, method="lttb"):
+    if method == "lttb":
+        return lttb_indices(x, y, max_points)
+    if method == "minmax":
+        return minmax_indices(y, max_points)
+    raise ValueError(f"Unknown downsampling method '{method}'")
@@ -1,9 +1,122 @@
+import asyncio
+import os
+import queue
 import serial
 import serial.tools.list_ports
+import threading
+import time
+from concurrent.futures import Future
+from metrics import registry
+from scheduler import scheduler
 from sys import version_info
 
 PY2 = version_info[0] == 2   #Running Python 2.x?
 
+#
+#---------------------------
+# Serial transport
+#---------------------------
+#
+# A dedicated I/O thread is the only thing that touches the serial port.
+# Callers submit (command bytes, reply length) requests and get a Future back.
+# Whatever is queued when the thread wakes up goes out in a single write, and
+# replies are read back in the same order, so each reply is matched to the
+# query that asked for it no matter which thread or coroutine sent it.
+#
+# The port's read timeout bounds every reply. A short reply fails that query
+# with TimeoutError and discards pending input, since a lost byte would
+# otherwise shift every later reply.
+#
+# Write times, reply round trips and errors go to the shared metrics
+# registry.
+#
+class Transport:
+    def __init__(self, port):
+        self.port = port
+        self._requests = queue.SimpleQueue()
+        self.writeTime = registry.histogram("maestro_write_seconds", "Time to write one batch of commands to the serial port")
+        self.roundTrip = registry.histogram("maestro_round_trip_seconds", "Time from a batch's write until each query's reply arrived")
+        self.errors = registry.counter("maestro_errors_total", "Failed writes, failed reads and lost replies")
+        self._thread = threading.Thread(target=self._run, name="maestro-io", daemon=True)
+        self._thread.start()
+
+    def submit(self, payload, replyLength=0):
+        future = Future()
+        self._requests.put((bytes(payload), replyLength, future))
+        return future
+
+    # Submit several (payload, replyLength) requests that are guaranteed to
+    # go out in the same write
+    def submitMany(self, requests):
+        batch = [(bytes(payload), replyLength, Future()) for payload, replyLength in requests]
+        self._requests.put(batch)
+        return [future for _, _, future in batch]
+
+    def close(self):
+        self._requests.put(None)
+        self._thread.join()
+
+    def _run(self):
+        running = True
+        while running:
+            batch = [self._requests.get()]
+            while True:
+                try:
+                    batch.append(self._requests.get_nowait())
+                except queue.Empty:
+                    break
+            batch = [request for item in batch for request in (item if isinstance(item, list) else [item])]
+            if None in batch:
+                running = False
+                batch = [request for request in batch if request is not None]
+            # Drop requests whose caller gave up (e.g. a timed-out query); the
+            # rest can no longer be cancelled
+            batch = [request for request in batch if request[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            # Nothing may end this thread, or every later command would hang
+            try:
+                self._runBatch(batch)
+            except Exception as e:
+                self.errors.inc()
+                print(f"Maestro I/O failed: {e!r}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _runBatch(self, batch):
+        start = time.perf_counter()
+        try:
+            self.port.write(b''.join(payload for payload, _, _ in batch))
+        except Exception as e:
+            self.errors.inc()
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        self.writeTime.observe(time.perf_counter() - start)
+
+        resync = False
+        for payload, replyLength, future in batch:
+            if replyLength == 0:
+                future.set_result(None)
+            elif resync:
+                future.set_exception(TimeoutError("Maestro reply lost; port resynchronized"))
+            else:
+                try:
+                    reply = self.port.read(replyLength)
+                except Exception as e:
+                    self.errors.inc()
+                    future.set_exception(e)
+                    continue
+                if len(reply) < replyLength:
+                    self.errors.inc()
+                    self.port.reset_input_buffer()
+                    resync = True
+                    future.set_exception(TimeoutError(f"Maestro did not reply to command 0x{payload[2]:02x}"))
+                else:
+                    self.roundTrip.observe(time.perf_counter() - start)
+                    future.set_result(reply)
+
 #
 #---------------------------
 # Maestro Servo Controller
@@ -29,10 +142,21 @@ class Controller:
     # assumes.  If two or more controllers are connected to different serial
     # ports, or you are using a Windows OS, you can provide the tty port.  For
     # example, '/dev/ttyACM2' or for Windows, something like 'COM3'.
-    def __init__(self, ttyStr='/dev/cu.usbmodem004552591', device=0x0c):
+    #
+    # Without a tty the MAESTRO_PORT environment variable is used if set. The
+    # port 'virtual' uses an in-process simulated Maestro (virtual_maestro.py).
+    #
+    # Replies that don't arrive within `timeout` seconds raise TimeoutError.
+    def __init__(self, ttyStr=None, device=0x0c, timeout=0.5):
+        if ttyStr is None:
+            ttyStr = os.environ.get('MAESTRO_PORT', '/dev/cu.usbmodem004552591')
         try:
             # Try to open the command port
-            self.usb = serial.Serial(ttyStr)
+            if ttyStr == 'virtual':
+                from virtual_maestro import VirtualMaestro
+                self.usb = VirtualMaestro(device=device, timeout=timeout)
+            else:
+                self.usb = serial.Serial(ttyStr, timeout=timeout)
         except serial.SerialException:
             print(f"Unable to open port {ttyStr}. Available ports:")
             available_ports = list(serial.tools.list_ports.comports())
@@ -40,8 +164,24 @@ class Controller:
                 print(f"- {port.device}")
             raise
 
+        self.timeout = timeout
+        self.transport = Transport(self.usb)
         # Command lead-in and device number are sent for each Pololu serial command.
-        self.PololuCmd = chr(0xaa) + chr(device)
+        self.PololuCmd = bytes((0xaa, device))
+        # Preallocated buffer for the hot setTarget path; only the channel and
+        # target bytes are rewritten per call.
+        self._targetCmd = bytearray((0xaa, device, 0x04, 0, 0, 0))
+        # Coalesced target updates waiting for flushTargets(), newest per channel
+        self._pendingTargets = {}
+        self._pendingLock = threading.Lock()
+        # Guards the preallocated command buffers
+        self._encodeLock = threading.Lock()
+        self._batchCmd = bytearray()
+        self._flushThread = None
+        # The Micro Maestro doesn't support Set Multiple Targets (0x1F)
+        self.multiTarget = True
+        # Position cache, see startTelemetry()
+        self.telemetry = None
         # Track target position for each servo. The function isMoving() will
         # use the Target vs Current servo position to determine if movement is
         # occuring.  Upto 24 servos on a Maestro, (0-23). Targets start at 0.
@@ -50,17 +190,26 @@ class Controller:
         self.Mins = [0] * 24
         self.Maxs = [0] * 24
         
-    # Cleanup by closing USB serial port
+    # Cleanup by stopping the I/O thread and closing USB serial port
     def close(self):
+        self.transport.close()
         self.usb.close()
 
-    # Send a Pololu command out the serial port
-    def sendCmd(self, cmd):
-        cmdStr = self.PololuCmd + cmd
-        if PY2:
-            self.usb.write(cmdStr)
-        else:
-            self.usb.write(bytes(cmdStr,'latin-1'))
+    # Send a Pololu command out the serial port. cmd is bytes (or a latin-1
+    # string of byte values, as older callers built them with chr()).
+    # Returns a Future resolving to the reply bytes if replyLength > 0.
+    def sendCmd(self, cmd, replyLength=0):
+        if not PY2 and isinstance(cmd, str):
+            cmd = bytes(cmd, 'latin-1')
+        return self.transport.submit(self.PololuCmd + cmd, replyLength)
+
+    # Block for a query's reply
+    def _wait(self, future):
+        return future.result(self.timeout * 4)
+
+    # Await a query's reply without blocking the event loop
+    async def _waitAsync(self, future):
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout * 4)
 
     # Set channels min and max value range.  Use this as a safety to protect
     # from accidentally moving outside known safe parameters. A setting of 0
@@ -89,19 +238,77 @@ class Controller:
     # Typcially valid servo range is 3000 to 9000 quarter-microseconds
     # If channel is configured for digital output, values < 6000 = Low ouput
     def setTarget(self, chan, target):
+        target = self._clampTarget(chan, target)
+        with self._encodeLock:
+            cmd = self._targetCmd
+            cmd[3] = chan
+            cmd[4] = target & 0x7f #7 bits for least significant byte
+            cmd[5] = (target >> 7) & 0x7f #shift 7 and take next 7 bits for msb
+            self.transport.submit(cmd)
+        # Record Target value
+        self.Targets[chan] = target
+
+    def _clampTarget(self, chan, target):
+        target = int(target)
         # if Min is defined and Target is below, force to Min
         if self.Mins[chan] > 0 and target < self.Mins[chan]:
             target = self.Mins[chan]
         # if Max is defined and Target is above, force to Max
         if self.Maxs[chan] > 0 and target > self.Maxs[chan]:
             target = self.Maxs[chan]
-        #    
-        lsb = target & 0x7f #7 bits for least significant byte
-        msb = (target >> 7) & 0x7f #shift 7 and take next 7 bits for msb
-        cmd = chr(0x04) + chr(chan) + chr(lsb) + chr(msb)
-        self.sendCmd(cmd)
-        # Record Target value
-        self.Targets[chan] = target
+        return target
+
+    # Queue a target without sending it. Only the newest queued target per
+    # channel matters, so repeated updates between flushes cost nothing.
+    # Safe to call from several threads.
+    def queueTarget(self, chan, target):
+        target = self._clampTarget(chan, target)
+        with self._pendingLock:
+            self._pendingTargets[chan] = target
+
+    # Send every queued target in a single serial write. Runs of consecutive
+    # channels are packed into one Set Multiple Targets (0x1F) command so they
+    # all start moving on the same frame.
+    def flushTargets(self):
+        with self._pendingLock:
+            if not self._pendingTargets:
+                return
+            pending = self._pendingTargets
+            self._pendingTargets = {}
+        with self._encodeLock:
+            cmd = self._batchCmd
+            del cmd[:]
+            channels = sorted(pending)
+            i = 0
+            while i < len(channels):
+                # Find the run of consecutive channels starting at channels[i]
+                j = i + 1
+                if self.multiTarget:
+                    while j < len(channels) and channels[j] == channels[j - 1] + 1:
+                        j += 1
+                if j - i == 1:
+                    cmd += self.PololuCmd
+                    cmd.append(0x04)
+                    cmd.append(channels[i])
+                else:
+                    cmd += self.PololuCmd
+                    cmd.append(0x1f)
+                    cmd.append(j - i)
+                    cmd.append(channels[i])
+                for chan in channels[i:j]:
+                    target = pending[chan]
+                    cmd.append(target & 0x7f)
+                    cmd.append((target >> 7) & 0x7f)
+                    self.Targets[chan] = target
+                i = j
+            self.transport.submit(cmd)
+
+    # Flush queued targets from a background thread every `period` seconds,
+    # so producers only ever call queueTarget()
+    def startAutoFlush(self, period=0.02):
+        if self._flushThread is not None:
+            return
+        self._flushThread = scheduler.run_thread("maestro-flush", period, self.flushTargets)
         
     # Set speed of channel
     # Speed is measured as 0.25microseconds/10milliseconds
@@ -111,7 +318,7 @@ class Controller:
     def setSpeed(self, chan, speed):
         lsb = speed & 0x7f #7 bits for least significant byte
         msb = (speed >> 7) & 0x7f #shift 7 and take next 7 bits for msb
-        cmd = chr(0x07) + chr(chan) + chr(lsb) + chr(msb)
+        cmd = bytes((0x07, chan, lsb, msb))
         self.sendCmd(cmd)
 
     # Set acceleration of channel
@@ -121,7 +328,7 @@ class Controller:
     def setAccel(self, chan, accel):
         lsb = accel & 0x7f #7 bits for least significant byte
         msb = (accel >> 7) & 0x7f #shift 7 and take next 7 bits for msb
-        cmd = chr(0x09) + chr(chan) + chr(lsb) + chr(msb)
+        cmd = bytes((0x09, chan, lsb, msb))
         self.sendCmd(cmd)
     
     # Get the current position of the device on the specified channel
@@ -131,12 +338,37 @@ class Controller:
     # to the servo. If the Speed is set to below the top speed of the servo, then
     # the position result will align well with the acutal servo position, assuming
     # it is not stalled or slowed.
+    #
+    # While telemetry is running, positions younger than its maxAge come from
+    # the cache instead of a serial round trip.
     def getPosition(self, chan):
-        cmd = chr(0x10) + chr(chan)
-        self.sendCmd(cmd)
-        lsb = ord(self.usb.read())
-        msb = ord(self.usb.read())
-        return (msb << 8) + lsb
+        if self.telemetry is not None:
+            position = self.telemetry.cachedPosition(chan)
+            if position is not None:
+                return position
+        reply = self._wait(self._queryPosition(chan))
+        return (reply[1] << 8) + reply[0]
+
+    async def getPositionAsync(self, chan):
+        if self.telemetry is not None:
+            position = self.telemetry.cachedPosition(chan)
+            if position is not None:
+                return position
+        reply = await self._waitAsync(self._queryPosition(chan))
+        return (reply[1] << 8) + reply[0]
+
+    def _queryPosition(self, chan):
+        cmd = bytes((0x10, chan))
+        return self.sendCmd(cmd, 2)
+
+    # Poll the positions of `channels` every `period` seconds in the
+    # background and serve getPosition()/isMoving() from the result. Readings
+    # older than maxAge seconds are considered stale and read directly.
+    def startTelemetry(self, channels, period=0.1, maxAge=0.25):
+        if self.telemetry is None:
+            self.telemetry = TelemetryPoller(self, channels, period, maxAge)
+            self.telemetry.start()
+        return self.telemetry
 
     # Test to see if a servo has reached the set target position.  This only provides
     # useful results if the Speed parameter is set slower than the maximum speed of
@@ -150,29 +382,105 @@ class Controller:
             if self.getPosition(chan) != self.Targets[chan]:
                 return True
         return False
+
+    async def isMovingAsync(self, chan):
+        if self.Targets[chan] > 0:
+            if await self.getPositionAsync(chan) != self.Targets[chan]:
+                return True
+        return False
     
     # Have all servo outputs reached their targets? This is useful only if Speed and/or
     # Acceleration have been set on one or more of the channels. Returns True or False.
     # Not available with Micro Maestro.
     def getMovingState(self):
-        cmd = chr(0x13)
-        self.sendCmd(cmd)
-        if self.usb.read() == chr(0):
-            return False
-        else:
-            return True
+        cmd = bytes((0x13,))
+        return self._wait(self.sendCmd(cmd, 1)) != b'\x00'
+
+    async def getMovingStateAsync(self):
+        cmd = bytes((0x13,))
+        return await self._waitAsync(self.sendCmd(cmd, 1)) != b'\x00'
 
     # Run a Maestro Script subroutine in the currently active script. Scripts can
     # have multiple subroutines, which get numbered sequentially from 0 on up. Code your
     # Maestro subroutine to either infinitely loop, or just end (return is not valid).
     def runScriptSub(self, subNumber):
-        cmd = chr(0x27) + chr(subNumber)
+        cmd = bytes((0x27, subNumber))
         # can pass a param with command 0x28
         # cmd = chr(0x28) + chr(subNumber) + chr(lsb) + chr(msb)
         self.sendCmd(cmd)
 
     # Stop the current Maestro Script
     def stopScript(self):
-        cmd = chr(0x24)
+        cmd = bytes((0x24,))
         self.sendCmd(cmd)
 
+# Open a Controller, retrying while the port isn't there yet (the Maestro
+# takes a moment to enumerate after a power cut). The last error is raised
+# after `attempts` tries.
+def openController(ttyStr=None, attempts=10, retryDelay=0.5, **kwargs):
+    for attempt in range(1, attempts + 1):
+        try:
+            return Controller(ttyStr, **kwargs)
+        except (serial.SerialException, OSError) as e:
+            if attempt == attempts:
+                raise
+            print(f"Maestro not ready ({e}), retrying in {retryDelay}s ({attempt}/{attempts})")
+            time.sleep(retryDelay)
+
+#
+#---------------------------
+# Telemetry poller
+#---------------------------
+#
+# Reads every configured channel in one pipelined burst (all queries in a
+# single write, replies read back to back) at a fixed rate and keeps the
+# latest snapshot. Any number of readers share one poll, and all channels in
+# a snapshot were read at the same moment.
+#
+class TelemetryPoller:
+    def __init__(self, controller, channels, period=0.1, maxAge=0.25):
+        self.controller = controller
+        self.channels = list(channels)
+        self.period = period
+        self.maxAge = maxAge
+        # (monotonic timestamp, {channel: position}), replaced atomically
+        self.snapshot = (0.0, {})
+        self._thread = None
+
+    # Read all channels once and publish the snapshot
+    def poll(self):
+        futures = self.controller.transport.submitMany(
+            [(self.controller.PololuCmd + bytes((0x10, chan)), 2) for chan in self.channels]
+        )
+        positions = {}
+        for chan, future in zip(self.channels, futures):
+            reply = self.controller._wait(future)
+            positions[chan] = (reply[1] << 8) + reply[0]
+        self.snapshot = (time.monotonic(), positions)
+        return self.snapshot
+
+    # Cached position if it's fresh enough, otherwise None
+    def cachedPosition(self, chan):
+        timestamp, positions = self.snapshot
+        if time.monotonic() - timestamp > self.maxAge:
+            return None
+        return positions.get(chan)
+
+    # Cached positions of several channels from one snapshot, so they were all
+    # read at the same moment; all None if the snapshot is older than maxAge
+    def cachedPositions(self, channels):
+        timestamp, positions = self.snapshot
+        fresh = time.monotonic() - timestamp <= self.maxAge
+        return {chan: positions.get(chan) if fresh else None for chan in channels}
+
+    def isMoving(self, chan):
+        target = self.controller.Targets[chan]
+        position = self.cachedPosition(chan)
+        if position is None:
+            return self.controller.isMoving(chan)
+        return target > 0 and position != target
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = scheduler.run_thread("maestro-telemetry", self.period, self.poll)
@@ -0,0 +1,73 @@
+import argparse
+import asyncio
+import time
+import maestro
+
+#
+# Maestro command throughput and latency benchmark
+#
+# Runs against the virtual Maestro by default, so it works anywhere:
+#
+#   python maestro_benchmark.py
+#   python maestro_benchmark.py --port /dev/ttyACM0
+#
+CHANNELS = [0, 1, 2]
+
+def report(name, count, elapsed):
+    print(f"{name:<34} {count / elapsed:10.0f} /s {elapsed / count * 1e6:10.1f} us each")
+
+def benchmark_set_target(servo, count):
+    start = time.perf_counter()
+    for i in range(count):
+        servo.setTarget(CHANNELS[i % len(CHANNELS)], 4000 + i % 4000)
+    # Make sure everything actually went out
+    servo.transport.submit(b'').result()
+    report("setTarget", count, time.perf_counter() - start)
+
+def benchmark_queued_targets(servo, count):
+    start = time.perf_counter()
+    for i in range(count):
+        for chan in CHANNELS:
+            servo.queueTarget(chan, 4000 + i % 4000)
+        servo.flushTargets()
+    servo.transport.submit(b'').result()
+    report(f"queueTarget x{len(CHANNELS)} + flushTargets", count, time.perf_counter() - start)
+
+def benchmark_get_position(servo, count):
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        servo.getPosition(CHANNELS[i % len(CHANNELS)])
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    report("getPosition round trip", count, sum(latencies))
+    print(f"{'':<34} p50 {latencies[count // 2] * 1e6:.1f} us, p99 {latencies[int(count * 0.99)] * 1e6:.1f} us")
+
+async def benchmark_pipelined_positions(servo, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        await asyncio.gather(*(servo.getPositionAsync(chan) for chan in CHANNELS))
+    report(f"getPositionAsync x{len(CHANNELS)} pipelined", count, time.perf_counter() - start)
+
+def benchmark_telemetry_poll(servo, count):
+    poller = maestro.TelemetryPoller(servo, CHANNELS)
+    start = time.perf_counter()
+    for _ in range(count):
+        poller.poll()
+    report(f"TelemetryPoller.poll x{len(CHANNELS)}", count, time.perf_counter() - start)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', default='virtual')
+    parser.add_argument('--count', type=int, default=2000)
+    args = parser.parse_args()
+
+    servo = maestro.Controller(args.port)
+    try:
+        benchmark_set_target(servo, args.count)
+        benchmark_queued_targets(servo, args.count)
+        benchmark_get_position(servo, args.count)
+        asyncio.run(benchmark_pipelined_positions(servo, args.count))
+        benchmark_telemetry_poll(servo, args.count)
+    finally:
+        servo.close()
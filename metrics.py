@@ -0,0 +1,199 @@
+import asyncio
+import bisect
+import collections
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from scheduler import JITTER_BUCKETS, scheduler
+
+#
+# Latency metrics
+#
+# Histograms are plain lists of bucket counts bumped with time.perf_counter()
+# deltas, cheap enough to wrap every stage of a control tick. Each histogram
+# has a single writer (the event loop or one I/O thread), so updates need no
+# lock; a reader may see a count one observation ahead of the sum, which
+# doesn't matter for monitoring.
+#
+# render() produces the Prometheus text exposition format, including the
+# scheduler's tick, overrun and lateness stats.
+#
+
+# Bucket upper bounds in seconds, from 50 us to 5 s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf'))
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+def _format_bound(bound):
+    return "+Inf" if bound == float('inf') else f"{bound:g}"
+
+def _histogram_lines(name, labels, buckets, counts, total, count):
+    lines = []
+    cumulative = 0
+    for bound, bucket_count in zip(buckets, counts):
+        cumulative += bucket_count
+        lines.append(f"{name}_bucket{_format_labels({**labels, 'le': _format_bound(bound)})} {cumulative}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return lines
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+#
+# A registry holds metric families by name; each family has one child per
+# label set, e.g. registry.histogram("control_stage_seconds", "...", stage="sensor_read")
+#
+class Registry:
+    def __init__(self):
+        self.families = {}
+        self.gauges = {}
+
+    def _child(self, kind, name, help, labels, factory):
+        family = self.families.setdefault(name, {"kind": kind, "help": help, "children": {}})
+        key = tuple(sorted(labels.items()))
+        if key not in family["children"]:
+            family["children"][key] = factory()
+        return family["children"][key]
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, **labels):
+        return self._child("histogram", name, help, labels, lambda: Histogram(buckets))
+
+    def counter(self, name, help, **labels):
+        return self._child("counter", name, help, labels, Counter)
+
+    # Gauges are read from a callback at scrape time
+    def gauge(self, name, help, func):
+        self.gauges[name] = (help, func)
+
+    def render(self):
+        lines = []
+        for name, family in self.families.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            for key, child in family["children"].items():
+                labels = dict(key)
+                if family["kind"] == "histogram":
+                    lines.extend(_histogram_lines(name, labels, child.buckets, child.counts, child.sum, child.count))
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {child.value}")
+        for name, (help, func) in self.gauges.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {func()}")
+        lines.extend(_scheduler_lines())
+        return "\n".join(lines) + "\n"
+
+def _scheduler_lines():
+    tickers = list(scheduler.tickers.items())
+    if not tickers:
+        return []
+    lines = [
+        "# HELP scheduler_ticks_total Periodic task wakeups",
+        "# TYPE scheduler_ticks_total counter",
+    ]
+    lines.extend(f'scheduler_ticks_total{{task="{name}"}} {ticker.stats.ticks}' for name, ticker in tickers)
+    lines.append("# HELP scheduler_overruns_total Wakeups that missed one or more whole periods")
+    lines.append("# TYPE scheduler_overruns_total counter")
+    lines.extend(f'scheduler_overruns_total{{task="{name}"}} {ticker.stats.overruns}' for name, ticker in tickers)
+    lines.append("# HELP scheduler_lateness_seconds How late each wakeup was past its deadline")
+    lines.append("# TYPE scheduler_lateness_seconds histogram")
+    for name, ticker in tickers:
+        stats = ticker.stats
+        lines.extend(_histogram_lines("scheduler_lateness_seconds", {"task": name}, JITTER_BUCKETS,
+                                      stats.histogram, stats.total_lateness, stats.ticks))
+    return lines
+
+# Shared by everything in the process
+registry = Registry()
+
+#
+# Profiling snapshots of a running server
+#
+# profile_event_loop() runs cProfile on the event loop thread for `seconds`,
+# which covers the control loop and every request handler. sample_stacks()
+# samples every thread's stack from a separate thread, so it also sees the
+# serial I/O, telemetry and executor threads; it reports the hottest frames
+# and collapsed stacks (the input format for flame graphs).
+#
+PROFILE_SORT_KEYS = tuple(pstats.Stats.sort_arg_dict_default)
+
+_profiler_lock = asyncio.Lock()
+
+# Only one profiler can hook the event loop thread at a time
+async def profile_event_loop(seconds, sort="cumulative", limit=40):
+    if _profiler_lock.locked():
+        raise RuntimeError("A profile is already running")
+    async with _profiler_lock:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+def _sample(seconds, interval, limit):
+    own = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    leaves = collections.Counter()
+    stacks = collections.Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            thread = names.get(ident, str(ident))
+            leaves[f"{thread}: {stack[0]}"] += 1
+            stacks[";".join([thread] + stack[::-1])] += 1
+        samples += 1
+        time.sleep(interval)
+
+    lines = [f"{samples} samples every {interval * 1000:g} ms", "", "Hottest frames:"]
+    lines.extend(f"{count:8d}  {frame}" for frame, count in leaves.most_common(limit))
+    lines.extend(["", "Collapsed stacks:"])
+    lines.extend(f"{stack} {count}" for stack, count in stacks.most_common(limit))
+    return "\n".join(lines) + "\n"
+
+async def sample_stacks(seconds, interval=0.005, limit=40):
+    return await asyncio.get_running_loop().run_in_executor(None, _sample, seconds, interval, limit)
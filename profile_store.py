@@ -0,0 +1,98 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Write the whole file next to the original and rename it into place, so a
+# reader or a crash never sees a half-written profile library
+def atomic_write(path, content):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+#
+# In-memory roast profile repository
+#
+# Profiles are read from disk once; reads are served from memory. Mutations
+# are serialized behind an asyncio lock and bump `version`, which backs the
+# ETag clients use to poll cheaply. With write_delay > 0 persistence is
+# debounced: a burst of edits results in a single atomic write.
+#
+class ProfileStore:
+    def __init__(self, path, write_delay=0.0):
+        self.path = path
+        self.write_delay = write_delay
+        self.profiles = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.profiles = json.load(f)
+        self.version = 0
+        # Distinguishes versions across restarts
+        self.generation = int(time.time() * 1000)
+        self.written_version = 0
+        self.lock = asyncio.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profile-store")
+        self._writer = None
+
+    @property
+    def etag(self):
+        return f'"{self.generation}-{self.version}"'
+
+    def all(self):
+        return self.profiles
+
+    def get(self, name):
+        return self.profiles.get(name)
+
+    async def save(self, name, profile):
+        async with self.lock:
+            self.profiles = {**self.profiles, name: profile}
+            await self._changed()
+
+    # Raises KeyError if the profile doesn't exist
+    async def delete(self, name):
+        async with self.lock:
+            if name not in self.profiles:
+                raise KeyError(name)
+            self.profiles = {key: value for key, value in self.profiles.items() if key != name}
+            await self._changed()
+
+    # Mutations replace the dict instead of editing it, so a reader iterating
+    # the old snapshot is never affected by a concurrent save
+    async def _changed(self):
+        self.version += 1
+        if self.write_delay <= 0:
+            await self._write()
+        elif self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_behind())
+
+    # Writes go through a single thread so snapshots land on disk in order
+    async def _write(self):
+        version = self.version
+        content = json.dumps(self.profiles, indent=2)
+        await asyncio.get_running_loop().run_in_executor(self._executor, atomic_write, self.path, content)
+        self.written_version = max(self.written_version, version)
+
+    async def _write_behind(self):
+        while self.written_version != self.version:
+            await asyncio.sleep(self.write_delay)
+            try:
+                await self._write()
+            except Exception as e:
+                print(f"Unable to save profiles: {e}")
+                return
+
+    # Persist any pending debounced write (e.g. on shutdown)
+    async def flush(self):
+        if self.written_version != self.version:
+            await self._write()
@@ -0,0 +1,187 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+import numpy as np
+from roast_log import read_log
+
+#
+# Roast log catalog
+#
+# A small SQLite database in the logs directory holding one row of metadata
+# and precomputed statistics per finished roast. Listing, filtering and
+# comparing roasts only touches the catalog, never the raw log files.
+#
+CATALOG_FILENAME = "catalog.sqlite3"
+
+CATALOG_COLUMNS = [
+    "filename", "started_at", "profile_name", "rows", "duration",
+    "first_crack_time", "peak_bean_temperature", "final_bean_temperature",
+    "mean_rate_of_rise", "tracking_rmse", "file_mtime",
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS roasts (
+    filename TEXT PRIMARY KEY,
+    started_at TEXT,
+    profile_name TEXT,
+    rows INTEGER,
+    duration REAL,
+    first_crack_time REAL,
+    peak_bean_temperature REAL,
+    final_bean_temperature REAL,
+    mean_rate_of_rise REAL,
+    tracking_rmse REAL,
+    file_mtime REAL
+);
+CREATE INDEX IF NOT EXISTS roasts_started_at ON roasts (started_at);
+CREATE INDEX IF NOT EXISTS roasts_profile_name ON roasts (profile_name);
+"""
+
+# Columns the listing endpoint may sort by
+SORTABLE_COLUMNS = set(CATALOG_COLUMNS) - {"file_mtime"}
+
+# First crack shows up as the sharpest drop ("crash") of the smoothed
+# rate-of-rise in the second half of the roast. This is only an estimate for
+# logs recorded before events were detected live.
+def estimate_first_crack(time, bean_temperature):
+    if len(time) < 10:
+        return None
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate_of_rise = np.gradient(bean_temperature, time) * 60
+        window = max(1, len(time) // 50)
+        smoothed = np.convolve(np.nan_to_num(rate_of_rise), np.ones(window) / window, mode='same')
+        slope = np.nan_to_num(np.gradient(smoothed, time))
+    half = len(time) // 2
+    return float(time[half + int(np.argmin(slope[half:]))])
+
+def summarize_log(header, data):
+    time = np.asarray(data["Time"], dtype=np.float64)
+    bean = np.asarray(data["Bean_Temperature"], dtype=np.float64)
+    metadata = header.get("metadata") or {}
+    events = metadata.get("events") or {}
+    summary = {
+        "started_at": metadata.get("started_at"),
+        "profile_name": metadata.get("profile_name"),
+        "rows": len(time),
+        "duration": None,
+        "first_crack_time": None,
+        "peak_bean_temperature": None,
+        "final_bean_temperature": None,
+        "mean_rate_of_rise": None,
+        "tracking_rmse": None,
+    }
+    if not len(time):
+        return summary
+
+    # Mean rate-of-rise (degrees/minute) from the turning point to the drop
+    if "turning_point" in events:
+        turning_point = min(int(np.searchsorted(time, events["turning_point"]["time"])), len(time) - 1)
+    else:
+        turning_point = int(np.argmin(bean))
+    if "first_crack" in events:
+        first_crack_time = events["first_crack"]["time"]
+    else:
+        first_crack_time = estimate_first_crack(time, bean)
+    elapsed = time[-1] - time[turning_point]
+    summary.update({
+        "duration": float(time[-1] - time[0]),
+        "first_crack_time": first_crack_time,
+        "peak_bean_temperature": float(bean.max()),
+        "final_bean_temperature": float(bean[-1]),
+        "mean_rate_of_rise": float((bean[-1] - bean[turning_point]) / elapsed * 60) if elapsed > 0 else None,
+    })
+    if "Target_Temperature" in data:
+        target = np.asarray(data["Target_Temperature"], dtype=np.float64)
+        summary["tracking_rmse"] = float(np.sqrt(np.mean((bean - target) ** 2)))
+    return summary
+
+class RoastCatalog:
+    def __init__(self, logs_dir):
+        self.logs_dir = logs_dir
+        self.path = os.path.join(logs_dir, CATALOG_FILENAME)
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+
+    # One short-lived connection per call keeps the catalog usable from the
+    # log finalizer thread as well as the event loop
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    # Summarize one finished log and insert or refresh its catalog entry
+    def add(self, filename):
+        filepath = os.path.join(self.logs_dir, filename)
+        header, data = read_log(filepath)
+        summary = summarize_log(header, data)
+        summary["filename"] = filename
+        summary["file_mtime"] = os.path.getmtime(filepath)
+        with self._connect() as db:
+            db.execute(
+                f"INSERT OR REPLACE INTO roasts ({', '.join(CATALOG_COLUMNS)}) "
+                f"VALUES ({', '.join(':' + name for name in CATALOG_COLUMNS)})",
+                summary,
+            )
+        return summary
+
+    # Bring the catalog in line with the logs directory: index logs written
+    # while the catalog was unavailable and forget deleted ones
+    def sync(self):
+        on_disk = {}
+        for filename in os.listdir(self.logs_dir):
+            if filename.endswith('.csv'):
+                on_disk[filename] = os.path.getmtime(os.path.join(self.logs_dir, filename))
+        with self._connect() as db:
+            known = dict(db.execute("SELECT filename, file_mtime FROM roasts").fetchall())
+            db.executemany("DELETE FROM roasts WHERE filename = ?", [(name,) for name in known.keys() - on_disk.keys()])
+        for filename, mtime in on_disk.items():
+            if known.get(filename) != mtime:
+                try:
+                    self.add(filename)
+                except Exception as e:
+                    print(f"Unable to catalog {filename}: {e}")
+
+    def get(self, filename):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM roasts WHERE filename = ?", (filename,)).fetchone()
+        return dict(row) if row else None
+
+    # Returns (total matching roasts, one page of summaries)
+    def query(self, profile_name=None, started_after=None, started_before=None,
+              min_duration=None, max_duration=None, sort="started_at", descending=True,
+              limit=50, offset=0):
+        if sort not in SORTABLE_COLUMNS:
+            raise ValueError(f"Cannot sort by '{sort}'")
+        conditions = []
+        params = []
+        for condition, value in [
+            ("profile_name = ?", profile_name),
+            ("started_at >= ?", started_after),
+            ("started_at <= ?", started_before),
+            ("duration >= ?", min_duration),
+            ("duration <= ?", max_duration),
+        ]:
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._connect() as db:
+            total = db.execute(f"SELECT COUNT(*) FROM roasts {where}", params).fetchone()[0]
+            rows = db.execute(
+                f"SELECT * FROM roasts {where} ORDER BY {sort} {'DESC' if descending else 'ASC'}, filename "
+                f"LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return total, [dict(row) for row in rows]
+
+    def compare(self, filenames):
+        placeholders = ', '.join('?' for _ in filenames)
+        with self._connect() as db:
+            rows = db.execute(f"SELECT * FROM roasts WHERE filename IN ({placeholders})", list(filenames)).fetchall()
+        by_name = {row["filename"]: dict(row) for row in rows}
+        return [by_name[name] for name in filenames if name in by_name]
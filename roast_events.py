@@ -0,0 +1,120 @@
+import math
+
+#
+# Streaming roast analytics
+#
+# Runs inside the control loop, one sample at a time, in O(1) time and
+# memory per sample:
+#
+#   RateOfRise          bean temperature rate-of-rise in degrees/minute
+#   RoastEventDetector  turning point, drying end and first crack
+#
+# Both take irregular sample spacing (dt comes from the clock), so they work
+# at any control rate and on any clock.
+#
+
+#
+# Rate-of-rise from two cascaded first-order low-pass filters: one on the
+# temperature, then one on the derivative of the smoothed temperature. Each
+# filter has time constant `time_constant` seconds; together they suppress
+# sensor noise far better than differencing raw samples, at the cost of
+# about 2 * time_constant seconds of lag.
+#
+class RateOfRise:
+    def __init__(self, time_constant=10.0):
+        self.time_constant = time_constant
+        self.reset()
+
+    def reset(self):
+        self.temperature = None
+        self.value = 0.0
+
+    # Feed one sample; returns the current rate-of-rise (0 from the first
+    # sample until the temperature moves)
+    def update(self, temperature, dt):
+        if self.temperature is None:
+            self.temperature = temperature
+            return self.value
+        if dt <= 0:
+            return self.value
+        alpha = dt / (self.time_constant + dt)
+        previous = self.temperature
+        self.temperature += alpha * (temperature - self.temperature)
+        rate = (self.temperature - previous) / dt * 60
+        self.value += alpha * (rate - self.value)
+        return self.value
+
+#
+# Roast events, each detected once per roast and reported as
+# {"time", "bean_temperature"}:
+#
+#   turning_point  the bottom of the post-charge dip, confirmed once the beans
+#                  have fallen at least turning_point_dip degrees below the
+#                  charge (first sample) temperature and then climbed
+#                  turning_point_rise degrees above the bottom
+#   drying_end     bean temperature reaches drying_end_temperature (yellowing)
+#   first_crack    above first_crack_min_temperature, the rate-of-rise
+#                  "crashes" to below crash_fraction of its peak since
+#                  crossing that temperature, as moisture flashing off absorbs
+#                  heat; failing that, bean temperature reaching
+#                  first_crack_temperature
+#
+# Beans are charged into a drum preheated past both event temperatures, so
+# drying end and first crack are only looked for after the turning point;
+# without a dip (no beans charged) no events are detected at all.
+#
+ROAST_EVENTS = ("turning_point", "drying_end", "first_crack")
+
+class RoastEventDetector:
+    def __init__(self, turning_point_dip=1.0, turning_point_rise=1.0, drying_end_temperature=160.0,
+                 first_crack_min_temperature=185.0, first_crack_temperature=196.0,
+                 crash_fraction=0.5, min_crash_peak=5.0):
+        self.turning_point_dip = turning_point_dip
+        self.turning_point_rise = turning_point_rise
+        self.drying_end_temperature = drying_end_temperature
+        self.first_crack_min_temperature = first_crack_min_temperature
+        self.first_crack_temperature = first_crack_temperature
+        self.crash_fraction = crash_fraction
+        self.min_crash_peak = min_crash_peak
+        self.reset()
+
+    def reset(self):
+        self.events = {}
+        self._charge_temperature = None
+        self._minimum = (math.inf, 0.0)
+        self._peak_rate_of_rise = 0.0
+
+    def _record(self, name, time, bean_temperature):
+        self.events[name] = {"time": float(time), "bean_temperature": float(bean_temperature)}
+
+    # Feed one sample; returns the names of events detected by it
+    def update(self, time, bean_temperature, rate_of_rise):
+        detected = []
+
+        if self._charge_temperature is None:
+            self._charge_temperature = bean_temperature
+
+        if "turning_point" not in self.events:
+            if bean_temperature < self._minimum[0]:
+                self._minimum = (bean_temperature, time)
+            elif (self._minimum[0] <= self._charge_temperature - self.turning_point_dip
+                  and bean_temperature >= self._minimum[0] + self.turning_point_rise):
+                self._record("turning_point", self._minimum[1], self._minimum[0])
+                detected.append("turning_point")
+            return detected
+
+        if "drying_end" not in self.events and bean_temperature >= self.drying_end_temperature:
+            self._record("drying_end", time, bean_temperature)
+            detected.append("drying_end")
+
+        if "first_crack" not in self.events and bean_temperature >= self.first_crack_min_temperature:
+            self._peak_rate_of_rise = max(self._peak_rate_of_rise, rate_of_rise)
+            crashed = (
+                self._peak_rate_of_rise >= self.min_crash_peak
+                and rate_of_rise < self.crash_fraction * self._peak_rate_of_rise
+            )
+            if crashed or bean_temperature >= self.first_crack_temperature:
+                self._record("first_crack", time, bean_temperature)
+                detected.append("first_crack")
+
+        return detected
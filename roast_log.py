@@ -0,0 +1,220 @@
+import csv
+import json
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+LOG_COLUMNS = ['Time', 'Bean_Temperature', 'Environment_Temperature', 'Fan_Speed', 'Heating_Power', 'Target_Temperature', 'Rate_Of_Rise']
+
+# Elapsed time keeps full precision; sensor and actuator columns fit in float32
+COLUMN_DTYPES = {name: np.float32 for name in LOG_COLUMNS}
+COLUMN_DTYPES['Time'] = np.float64
+
+#
+# Columnar binary log (.rlog)
+#
+#   16-byte preamble: b"RLOG", uint16 version, uint16 reserved, uint32 header
+#                     length, uint32 reserved (little-endian)
+#   JSON header:      row count, column names/dtypes/offsets, profile, metadata
+#   column data:      one contiguous little-endian array per column, each
+#                     starting on an 8-byte boundary
+#
+# Columns are read back with np.memmap, so opening a log costs a header parse
+# and only the columns actually touched are paged in.
+#
+BINARY_LOG_EXTENSION = ".rlog"
+_MAGIC = b"RLOG"
+_VERSION = 1
+_PREAMBLE = struct.Struct("<4sHHII")
+
+def _align(offset, alignment=8):
+    return (offset + alignment - 1) // alignment * alignment
+
+def binary_log_path(path):
+    return os.path.splitext(path)[0] + BINARY_LOG_EXTENSION
+
+def write_columnar_log(path, columns, profile=None, metadata=None):
+    names = list(columns)
+    arrays = [np.ascontiguousarray(columns[name], dtype=np.dtype(COLUMN_DTYPES.get(name, np.float64)).newbyteorder("<")) for name in names]
+    rows = len(arrays[0]) if arrays else 0
+
+    # Offsets depend on the header length, which depends on the offsets;
+    # iterate until the header stops growing.
+    header_length = 0
+    while True:
+        offset = _align(_PREAMBLE.size + header_length)
+        column_headers = []
+        for name, array in zip(names, arrays):
+            column_headers.append({"name": name, "dtype": array.dtype.str, "offset": offset})
+            offset = _align(offset + array.nbytes)
+        header = json.dumps({
+            "rows": rows,
+            "columns": column_headers,
+            "profile": profile,
+            "metadata": metadata or {},
+        }).encode()
+        if len(header) <= header_length:
+            break
+        header_length = len(header)
+    header = header.ljust(header_length)
+
+    with open(path, 'wb') as file:
+        file.write(_PREAMBLE.pack(_MAGIC, _VERSION, 0, header_length, 0))
+        file.write(header)
+        for column, array in zip(column_headers, arrays):
+            file.seek(column["offset"])
+            file.write(array.tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+
+def read_columnar_header(path):
+    with open(path, 'rb') as file:
+        magic, version, _, header_length, _ = _PREAMBLE.unpack(file.read(_PREAMBLE.size))
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} is not a version {_VERSION} roast log")
+        return json.loads(file.read(header_length))
+
+# Returns (header, {name: read-only memmap}) for the requested columns
+def read_columnar_log(path, columns=None):
+    header = read_columnar_header(path)
+    data = {}
+    for column in header["columns"]:
+        if columns is not None and column["name"] not in columns:
+            continue
+        if header["rows"] == 0:
+            data[column["name"]] = np.empty(0, dtype=column["dtype"])
+        else:
+            data[column["name"]] = np.memmap(path, dtype=column["dtype"], mode='r', offset=column["offset"], shape=(header["rows"],))
+    return header, data
+
+def read_csv_log(path, columns=None):
+    with open(path, 'r', newline='') as file:
+        names = next(csv.reader(file))
+        values = np.loadtxt(file, delimiter=',', ndmin=2)
+    data = {}
+    for index, name in enumerate(names):
+        if columns is None or name in columns:
+            data[name] = values[:, index] if values.size else np.empty(0)
+    return {"rows": len(values), "profile": None, "metadata": {}}, data
+
+# Load a log of either format, preferring the binary copy of a CSV log
+def read_log(path, columns=None):
+    if path.endswith(BINARY_LOG_EXTENSION):
+        return read_columnar_log(path, columns)
+    binary_path = binary_log_path(path)
+    if os.path.exists(binary_path):
+        return read_columnar_log(binary_path, columns)
+    return read_csv_log(path, columns)
+
+# fsync and the final rename can stall for a long time on an SD card, so they
+# run on a single background thread instead of the event loop.
+_sync_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="roast-log-sync")
+
+def _sync_file(fd):
+    try:
+        os.fsync(fd)
+    except OSError as e:
+        print(f"Roast log fsync failed: {e}")
+
+def _finalize_file(file, partial_path, path, rows_file, rows_path, row_count, profile, metadata):
+    file.flush()
+    os.fsync(file.fileno())
+    file.close()
+    rows_file.close()
+
+    # Transpose the row spill into the columnar binary log next to the CSV
+    if row_count:
+        rows = np.memmap(rows_path, dtype='<f8', mode='r', shape=(row_count, len(LOG_COLUMNS)))
+    else:
+        rows = np.empty((0, len(LOG_COLUMNS)))
+    binary_path = binary_log_path(path)
+    write_columnar_log(binary_path + ".partial", {name: rows[:, index] for index, name in enumerate(LOG_COLUMNS)}, profile, metadata)
+    del rows
+    os.remove(rows_path)
+
+    # Atomically publish the finished logs under their final names
+    os.replace(binary_path + ".partial", binary_path)
+    os.replace(partial_path, path)
+    directory_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(directory_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(directory_fd)
+    print(f"Roast data saved to {path}")
+
+# "<directory>/<stem>.csv", or "<stem>_2.csv", "<stem>_3.csv", ... if that
+# log (or its binary twin) already exists or is still being written. Roasts
+# on a virtual clock can finish several times within one wall-clock second,
+# and a reused name would silently replace the earlier log.
+def unique_log_path(directory, stem):
+    path = os.path.join(directory, f"{stem}.csv")
+    copy = 1
+    while any(os.path.exists(taken) for taken in (path, path + ".partial", binary_log_path(path))):
+        copy += 1
+        path = os.path.join(directory, f"{stem}_{copy}.csv")
+    return path
+
+#
+# Append-only roast log
+#
+# Each sample is written to "<path>.partial" as soon as it is produced. Rows
+# are flushed to the OS every `flush_every` samples and fsynced at most every
+# `fsync_interval` seconds, so a crash loses at most a few seconds of data.
+# Samples are also spilled as raw float64 rows, which close() transposes into
+# the columnar binary log before renaming both files to their final names.
+#
+class RoastLogWriter:
+    _row = struct.Struct("<" + "d" * len(LOG_COLUMNS))
+
+    def __init__(self, path, flush_every=10, fsync_interval=5.0, profile=None, metadata=None):
+        self.path = path
+        self.partial_path = path + ".partial"
+        self.rows_path = binary_log_path(path) + ".rows"
+        self.profile = profile
+        self.metadata = metadata
+        self.flush_every = flush_every
+        self.fsync_interval = fsync_interval
+        self.rows = 0
+        self.pending_rows = 0
+        self.last_sync = time.monotonic()
+        self.closed = False
+
+        self.file = open(self.partial_path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(LOG_COLUMNS)
+        self.rows_file = open(self.rows_path, 'wb')
+
+    # Time is elapsed roast seconds; target is the value the controller used;
+    # rate-of-rise is the bean temperature's, in degrees/minute
+    def append(self, elapsed_time, bean_temperature, env_temperature, fan_speed, heating_power, target_temperature, rate_of_rise):
+        row = (elapsed_time, bean_temperature, env_temperature, fan_speed, heating_power, target_temperature, rate_of_rise)
+        self.writer.writerow(row)
+        self.rows_file.write(self._row.pack(*row))
+        self.rows += 1
+        self.pending_rows += 1
+        if self.pending_rows >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        self.rows_file.flush()
+        self.pending_rows = 0
+        now = time.monotonic()
+        if now - self.last_sync >= self.fsync_interval:
+            self.last_sync = now
+            _sync_executor.submit(_sync_file, self.file.fileno())
+
+    # Finalize the log in the background; returns a future that completes
+    # once the file is durable under its final name.
+    def close(self):
+        if self.closed:
+            return None
+        self.closed = True
+        return _sync_executor.submit(
+            _finalize_file, self.file, self.partial_path, self.path,
+            self.rows_file, self.rows_path, self.rows, self.profile, self.metadata,
+        )
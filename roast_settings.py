@@ -0,0 +1,62 @@
+from pydantic import BaseModel, PrivateAttr
+from typing import List, Optional
+import numpy as np
+
+#
+# Roast profiles
+#
+# A profile is a list of (time, temperature) setpoints; the target between
+# them follows a cubic spline through the setpoints.
+#
+# scipy.interpolate takes longer to import than the rest of the server put
+# together, so it is imported when the first spline is built; the server
+# warms it in the background once it is up (see SPLINE_MODULE).
+#
+SPLINE_MODULE = "scipy.interpolate"
+
+class SetPoint(BaseModel):
+    time: float
+    temperature: float
+
+class RoastSettings(BaseModel):
+    setpoints: List[SetPoint]
+    name: Optional[str] = None
+    # Cached interpolator and the setpoints it was built from
+    _spline = PrivateAttr(default=None)
+    _spline_key = PrivateAttr(default=None)
+
+    # Build the interpolator once per setpoint list; it is rebuilt only when
+    # the setpoints change. Returns None for a single (constant) setpoint.
+    def get_spline(self):
+        if not self.setpoints:
+            raise ValueError("No setpoints defined. Cannot calculate target temperature.")
+        
+        key = tuple((sp.time, sp.temperature) for sp in self.setpoints)
+        if key != self._spline_key:
+            if len(key) == 1:
+                self._spline = None
+            else:
+                from scipy.interpolate import CubicSpline
+                times, temperatures = np.array(key, dtype=float).T
+                self._spline = CubicSpline(times, temperatures)
+            self._spline_key = key
+        return self._spline
+
+    # Vectorized target evaluation over an array of times
+    def get_target_temperatures(self, times):
+        spline = self.get_spline()
+        times = np.asarray(times, dtype=float)
+        if spline is None:
+            # If there's only one setpoint, the target is its temperature
+            return np.full(times.shape, float(self.setpoints[0].temperature))
+        return spline(times)
+
+    def get_target_temperature(self, current_time):
+        return float(self.get_target_temperatures(current_time))
+
+    # Rate of change of the target in degrees/second, for feed-forward
+    def get_target_slope(self, current_time):
+        spline = self.get_spline()
+        if spline is None:
+            return 0.0
+        return float(spline(current_time, 1))
@@ -0,0 +1,369 @@
+import asyncio
+import os
+from datetime import datetime
+import numpy as np
+from broadcast import BroadcastHub
+from clock import VirtualClock
+from controllers import make_controller, relay_autotune
+from metrics import registry
+from roast_events import RateOfRise, RoastEventDetector
+from roast_log import RoastLogWriter, unique_log_path
+from roast_settings import RoastSettings, SetPoint
+from roaster_sim import SimulatedRoaster
+from sample_ring import SampleRing
+from sensor_acquisition import StaleReadingError
+from scheduler import scheduler
+
+#
+# Roaster sessions
+#
+# Everything that belongs to one physical (or simulated) roaster lives in a
+# RoasterSession: the hardware backend, controller, roast state, log writer,
+# analytics, telemetry hub and ring buffer, and its control task. Any number
+# of sessions run side by side on the server's event loop, each ticking on
+# its own fixed-rate schedule; they share only the clock, the logs directory
+# and the metrics registry.
+#
+# The request handlers in coffee-roaster-control.py look a session up by
+# roaster ID and call its methods; the methods return the same messages the
+# endpoints always have.
+#
+
+# The control loop ticks once per roast-clock second no matter how many
+# clients are watching; clients subscribe to the session's hub
+CONTROL_PERIOD = 1.0
+
+# Samples are streamed to disk while roasting: flushed every LOG_FLUSH_EVERY
+# rows and fsynced at most every LOG_FSYNC_INTERVAL seconds
+LOG_FLUSH_EVERY = 10
+LOG_FSYNC_INTERVAL = 5.0
+
+# The current roast's samples, for clients that join late or reconnect
+TELEMETRY_BUFFER_SIZE = 7200
+
+# Routes without a roaster ID act on this one
+DEFAULT_ROASTER = "default"
+
+# Hot-path timings, served at /metrics
+CONTROL_STAGES = ("sensor_read", "target", "controller", "actuate", "analytics", "log", "publish")
+
+class RoasterSession:
+    def __init__(self, roaster_id, roaster, clock, logs_dir, clock_kind=None, on_log_saved=None):
+        self.roaster_id = roaster_id
+        self.roaster = roaster
+        self.clock = clock
+        self.clock_kind = clock_kind
+        self.logs_dir = logs_dir
+        # Called with the log's filename once it is durable on disk
+        self.on_log_saved = on_log_saved
+
+        self.controller = make_controller("pid")
+        # Streaming rate-of-rise and roast event detection, computed once per sample
+        self.rate_of_rise = RateOfRise()
+        self.event_detector = RoastEventDetector()
+        self.hub = BroadcastHub()
+        self.telemetry_buffer = SampleRing(TELEMETRY_BUFFER_SIZE)
+
+        self.roast_settings = RoastSettings(setpoints=[SetPoint(time=0.0, temperature=200.0)])
+        self.is_roasting = False
+        self.is_preheating = False
+        self.is_roast_completed = False
+        self.preheat_target_temperature = 0
+        self.roast_start_time = None
+        self.roast_log = None
+
+        # Why control is suspended while the sensors can't be trusted, or None
+        self.sensor_fault = None
+
+        self.control_task = None
+        self.autotune_task = None
+        self.autotune_result = None
+
+        self.stage_timers = {
+            stage: registry.histogram("roaster_control_stage_seconds", "Time spent in each stage of a control tick",
+                                      roaster=roaster_id, stage=stage)
+            for stage in CONTROL_STAGES
+        }
+        self.tick_timer = registry.histogram("roaster_control_tick_seconds", "Work time of one whole control tick", roaster=roaster_id)
+
+    @property
+    def simulated(self):
+        return isinstance(self.roaster, SimulatedRoaster)
+
+    @property
+    def autotuning(self):
+        return self.autotune_task is not None and not self.autotune_task.done()
+
+    @property
+    def status(self):
+        return {
+            "roaster_id": self.roaster_id,
+            "simulated": self.simulated,
+            "is_preheating": self.is_preheating,
+            "is_roasting": self.is_roasting,
+            "is_roast_completed": self.is_roast_completed,
+            "autotuning": self.autotuning,
+            "profile_name": self.roast_settings.name,
+            "sensor_fault": self.sensor_fault,
+            "clients": self.hub.subscriber_count,
+        }
+
+    def start(self):
+        if self.control_task is None:
+            self.control_task = asyncio.create_task(self.control_loop(), name=f"control-{self.roaster_id}")
+
+    def stop(self):
+        if self.control_task is not None:
+            self.control_task.cancel()
+            self.control_task = None
+
+    async def control_loop(self):
+        ticker = scheduler.async_ticker(f"control-{self.roaster_id}", CONTROL_PERIOD, self.clock)
+        stage_timers = self.stage_timers
+        last_tick = None
+        while True:
+            try:
+                if self.is_roasting or self.is_preheating:
+                    with self.tick_timer.time():
+                        now = self.clock.now()
+                        dt = now - last_tick if last_tick is not None else CONTROL_PERIOD
+                        last_tick = now
+                        current_time = now - self.roast_start_time if self.is_roasting else 0
+                        with stage_timers["sensor_read"].time():
+                            bean_temperature, env_temperature = self.roaster.read_temperatures()
+                        if self.sensor_fault is not None:
+                            self.clear_sensor_fault()
+
+                        with stage_timers["target"].time():
+                            if self.is_roasting:
+                                target_temperature = self.roast_settings.get_target_temperature(current_time)
+                                target_slope = self.roast_settings.get_target_slope(current_time)
+                            else:  # preheating
+                                target_temperature = self.preheat_target_temperature
+                                target_slope = 0.0
+
+                        with stage_timers["controller"].time():
+                            fan_speed, heating_power = self.controller.update(target_temperature, target_slope, bean_temperature, env_temperature, dt)
+                            fan_speed, heating_power = float(fan_speed), float(heating_power)
+
+                        with stage_timers["actuate"].time():
+                            self.roaster.set_fan_speed(fan_speed)
+                            self.roaster.set_heating_element(heating_power)
+
+                        with stage_timers["analytics"].time():
+                            bean_rate_of_rise = self.rate_of_rise.update(bean_temperature, dt)
+                            if self.is_roasting:
+                                self.event_detector.update(current_time, bean_temperature, bean_rate_of_rise)
+
+                        if self.is_roasting:
+                            with stage_timers["log"].time():
+                                self.roast_log.append(current_time, bean_temperature, env_temperature, fan_speed, heating_power, target_temperature, bean_rate_of_rise)
+
+                        with stage_timers["publish"].time():
+                            frame = {
+                                "time": current_time,
+                                "bean_temperature": bean_temperature,
+                                "env_temperature": env_temperature,
+                                "target_temperature": target_temperature,
+                                "fan_speed": fan_speed,
+                                "heating_power": heating_power,
+                                "rate_of_rise": bean_rate_of_rise,
+                                "events": dict(self.event_detector.events),
+                                "is_preheating": self.is_preheating,
+                                "is_roasting": self.is_roasting,
+                                "is_roast_completed": self.is_roast_completed
+                            }
+                            frame["seq"] = self.telemetry_buffer.append(frame)
+                            self.hub.publish(frame)
+
+                    # Check if the roast should end (only if we're actually roasting)
+                    if self.is_roasting and current_time >= self.roast_settings.setpoints[-1].time and bean_temperature >= target_temperature:
+                        self.is_roasting = False
+                        self.is_roast_completed = True
+                        self.save_roast_data()
+                        self.hub.publish({"roast_finished": True})
+                else:
+                    last_tick = None
+            except StaleReadingError as e:
+                # Never keep heating on temperatures that can't be trusted
+                self.roaster.set_heating_element(0.0)
+                if self.sensor_fault is None:
+                    self.set_sensor_fault(str(e))
+            except Exception as e:
+                print(f"Control loop error ({self.roaster_id}): {e}")
+
+            # Absolute deadlines keep samples evenly spaced whatever the work took
+            await ticker.wait()
+
+    # Sensor faults are logged and published to clients when they start and
+    # when they clear, not on every tick in between
+    def set_sensor_fault(self, message):
+        self.sensor_fault = {"message": message, "heater_off": True}
+        print(f"Sensor fault ({self.roaster_id}), heater off: {message}")
+        self.hub.publish({"sensor_fault": self.sensor_fault})
+
+    def clear_sensor_fault(self):
+        self.sensor_fault = None
+        print(f"Sensors recovered ({self.roaster_id}), control resumed")
+        self.hub.publish({"sensor_fault": None})
+
+    def start_preheat(self):
+        if self.is_roasting:
+            return {"message": "Cannot start preheating while roasting"}
+        if self.autotuning:
+            return {"message": "Cannot start preheating while autotuning"}
+
+        # Get the first setpoint temperature
+        first_setpoint = self.roast_settings.setpoints[0] if self.roast_settings.setpoints else None
+        if not first_setpoint:
+            return {"message": "No setpoints defined"}
+
+        self.preheat_target_temperature = first_setpoint.temperature
+        self.controller.reset()
+        self.rate_of_rise.reset()
+        self.is_preheating = True
+        self.is_roast_completed = False
+        return {"message": f"Preheating started to {self.preheat_target_temperature}°C"}
+
+    def start_roast(self, settings):
+        if self.is_roasting:
+            return {"message": "A roast is already in progress"}
+        if not self.is_preheating:
+            return {"message": "Please preheat before starting the roast"}
+        self.roast_settings = settings
+        self.is_roasting = True
+        self.is_preheating = False
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # The default roaster keeps the original log names
+        prefix = "roast_log" if self.roaster_id == DEFAULT_ROASTER else f"roast_log_{self.roaster_id}"
+        self.roast_log = RoastLogWriter(
+            unique_log_path(self.logs_dir, f"{prefix}_{timestamp}"),
+            flush_every=LOG_FLUSH_EVERY,
+            fsync_interval=LOG_FSYNC_INTERVAL,
+            profile=[sp.dict() for sp in settings.setpoints],
+            metadata={
+                "started_at": datetime.now().isoformat(),
+                "profile_name": settings.name,
+                "roaster_id": self.roaster_id,
+                "simulated": self.simulated,
+                "clock": self.clock_kind,
+            },
+        )
+        self.roast_start_time = self.clock.now()
+        self.event_detector.reset()
+        self.telemetry_buffer.clear()
+
+        # Generate the entire roast profile
+        total_time = settings.setpoints[-1].time
+        time_points = np.linspace(0, total_time, num=int(total_time)+1)
+        target_temperatures = settings.get_target_temperatures(time_points)
+
+        return {
+            "message": "Roast started",
+            "profile": {
+                "time": time_points.tolist(),
+                "target_temperature": target_temperatures.tolist()
+            }
+        }
+
+    def stop_roast(self):
+        if not self.is_roasting:
+            return {"message": "No roast in progress"}
+        self.is_roasting = False
+        self.is_roast_completed = True
+        self.save_roast_data()
+        return {"message": "Roast stopped"}
+
+    def reset_roast(self):
+        if self.is_roasting:
+            # Keep what was recorded of the aborted roast
+            self.save_roast_data()
+        self.is_roasting = False
+        self.is_preheating = False
+        self.is_roast_completed = False
+        return {"message": "Roast reset, ready for preheating"}
+
+    # Finalize the streamed log; the fsync, rename and on_log_saved callback
+    # happen in the background
+    def save_roast_data(self):
+        if self.roast_log is None:
+            return
+        filename = os.path.basename(self.roast_log.path)
+        # Detected events go into the log header alongside the profile
+        self.roast_log.metadata["events"] = dict(self.event_detector.events)
+        finalized = self.roast_log.close()
+        if finalized is not None:
+            finalized.add_done_callback(lambda future: self.log_finalized(filename, future))
+
+    # Runs on the log writer's thread once the log is finalized (or failed to be)
+    def log_finalized(self, filename, future):
+        if future.cancelled() or future.exception() is not None:
+            error = "cancelled" if future.cancelled() else repr(future.exception())
+            print(f"Failed to save roast log {filename} for {self.roaster_id}: {error}")
+            return
+        if self.on_log_saved is not None:
+            self.on_log_saved(filename)
+
+    # Replace the active controller, e.g. {"kind": "pid", "kp": 0.04, "ki": 0.001};
+    # raises TypeError or ValueError for bad settings
+    def set_controller(self, settings):
+        settings = dict(settings)
+        self.controller = make_controller(settings.pop("kind", "pid"), **settings)
+        return self.controller.settings
+
+    async def run_autotune(self, setpoint, apply):
+        if self.simulated:
+            # Tune a copy of the simulator on a virtual clock; it finishes almost
+            # instantly and leaves the live roaster alone
+            tune_clock = VirtualClock()
+            tune_roaster = SimulatedRoaster(clock=tune_clock, **self.roaster.params)
+        else:
+            tune_clock, tune_roaster = self.clock, self.roaster
+        try:
+            self.autotune_result = await relay_autotune(tune_roaster, tune_clock, setpoint)
+        except Exception as e:
+            self.autotune_result = {"error": str(e)}
+            return
+        if apply:
+            settings = self.controller.settings if self.controller.kind == "pid" else {"kind": "pid"}
+            settings.update({name: self.autotune_result[name] for name in ("kp", "ki", "kd")})
+            self.controller = make_controller(**settings)
+
+    def start_autotune(self, setpoint, apply):
+        if self.is_roasting or self.is_preheating:
+            return {"message": "Cannot autotune while preheating or roasting"}
+        if self.autotuning:
+            return {"message": "Autotune already running"}
+        self.autotune_result = None
+        self.autotune_task = asyncio.create_task(self.run_autotune(setpoint, apply))
+        return {"message": f"Autotune started around {setpoint}°C"}
+
+#
+# All sessions in the process, by roaster ID
+#
+class SessionManager:
+    def __init__(self):
+        self.sessions = {}
+
+    def __iter__(self):
+        return iter(self.sessions.values())
+
+    def __contains__(self, roaster_id):
+        return roaster_id in self.sessions
+
+    def get(self, roaster_id):
+        return self.sessions.get(roaster_id)
+
+    def add(self, session):
+        if session.roaster_id in self.sessions:
+            raise ValueError(f"Roaster '{session.roaster_id}' already exists")
+        self.sessions[session.roaster_id] = session
+        return session
+
+    def start_all(self):
+        for session in self:
+            session.start()
+
+    def stop_all(self):
+        for session in self:
+            session.stop()
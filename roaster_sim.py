@@ -0,0 +1,167 @@
+import json
+import numpy as np
+from clock import RealClock
+from controllers import ProportionalController
+
+#
+# Roaster thermal model
+#
+# Heating power reaches the drum through a first-order lag, the environment
+# loses heat exponentially faster the hotter it is above ambient (more with
+# the fan on, capped at max_cooling_rate), and the beans follow the
+# environment temperature. thermal_step works on scalars or NumPy arrays, so
+# the real-time simulator and the batch simulator share the same physics.
+#
+DEFAULT_THERMAL_PARAMS = {
+    "heating_lag": 5.0,
+    "heating_efficiency": 10.0,
+    "max_cooling_rate": 5.0,
+    "ambient_temperature": 25.0,
+    "bean_coupling": 0.1,
+    "cooling_scale": 100.0,
+}
+
+def thermal_step(bean_temperature, env_temperature, current_heating_power, heating_power, fan_speed, dt,
+                 heating_lag, heating_efficiency, max_cooling_rate, ambient_temperature, bean_coupling, cooling_scale):
+    # Update current heating power based on lag
+    current_heating_power = current_heating_power + (heating_power - current_heating_power) * dt / heating_lag
+
+    # Calculate heating effect
+    heating_effect = current_heating_power * heating_efficiency * dt
+
+    # Calculate cooling effect
+    env_cooling_factor = np.exp((env_temperature - ambient_temperature) / cooling_scale) - 1
+    env_cooling_effect = np.minimum(max_cooling_rate, env_cooling_factor * (1 + fan_speed)) * dt
+
+    # Update environment temperature
+    env_temperature = env_temperature + heating_effect - env_cooling_effect
+
+    # Update bean temperature (lags behind environment temperature)
+    bean_temperature = bean_temperature + (env_temperature - bean_temperature) * bean_coupling * dt
+
+    # Ensure temperatures don't go below ambient
+    env_temperature = np.maximum(env_temperature, ambient_temperature)
+    bean_temperature = np.maximum(bean_temperature, ambient_temperature)
+
+    return bean_temperature, env_temperature, current_heating_power
+
+# Thermal parameters from a file written by system_id.py (or by hand): a JSON
+# object whose "params" hold any of the DEFAULT_THERMAL_PARAMS names
+def load_thermal_params(path):
+    with open(path) as file:
+        params = json.load(file).get("params", {})
+    unknown = set(params) - set(DEFAULT_THERMAL_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown thermal parameters in {path}: {', '.join(sorted(unknown))}")
+    return {name: float(value) for name, value in params.items()}
+
+# Simulated roaster. Time advances with `clock`; with a VirtualClock the
+# simulation is deterministic and runs as fast as it is stepped.
+class SimulatedRoaster:
+    def __init__(self, heating_lag=5.0, clock=None, **params):
+        params = {**DEFAULT_THERMAL_PARAMS, "heating_lag": heating_lag, **params}
+        self.heating_lag = params["heating_lag"]
+        self.heating_efficiency = params["heating_efficiency"]
+        self.max_cooling_rate = params["max_cooling_rate"]
+        self.ambient_temperature = params["ambient_temperature"]
+        self.bean_coupling = params["bean_coupling"]
+        self.cooling_scale = params["cooling_scale"]
+        self.bean_temperature = self.ambient_temperature
+        self.env_temperature = self.ambient_temperature
+        self.fan_speed = 0.0
+        self.heating_power = 0.0
+        self.current_heating_power = 0.0
+        self.clock = clock or RealClock()
+        self.last_update_time = self.clock.now()
+
+    @property
+    def params(self):
+        return {name: getattr(self, name) for name in DEFAULT_THERMAL_PARAMS}
+
+    def read_temperatures(self):
+        current_time = self.clock.now()
+        elapsed_time = current_time - self.last_update_time
+        self.last_update_time = current_time
+
+        bean_temperature, env_temperature, current_heating_power = thermal_step(
+            self.bean_temperature, self.env_temperature, self.current_heating_power,
+            self.heating_power, self.fan_speed, elapsed_time, **self.params,
+        )
+        self.bean_temperature = float(bean_temperature)
+        self.env_temperature = float(env_temperature)
+        self.current_heating_power = float(current_heating_power)
+
+        return self.bean_temperature, self.env_temperature
+
+    def set_fan_speed(self, speed):
+        self.fan_speed = max(0, min(1, speed))
+
+    def set_heating_element(self, power):
+        self.heating_power = max(0, min(1, power))
+
+#
+# Batch simulator
+#
+# Steps N independent roasters at once with a fixed dt. Every thermal
+# parameter may be a scalar or an array of N values, so one batch can sweep
+# machine parameters as well as profiles and controller settings.
+#
+class BatchRoasterSimulator:
+    def __init__(self, n, dt=1.0, **params):
+        self.n = n
+        self.dt = dt
+        self.params = {
+            name: np.broadcast_to(np.asarray(value, dtype=np.float64), (n,))
+            for name, value in {**DEFAULT_THERMAL_PARAMS, **params}.items()
+        }
+        self.reset()
+
+    def reset(self, bean_temperature=None, env_temperature=None):
+        ambient = self.params["ambient_temperature"]
+        self.bean_temperature = np.array(np.broadcast_to(ambient if bean_temperature is None else bean_temperature, (self.n,)), dtype=np.float64)
+        self.env_temperature = np.array(np.broadcast_to(ambient if env_temperature is None else env_temperature, (self.n,)), dtype=np.float64)
+        self.current_heating_power = np.zeros(self.n)
+        self.fan_speed = np.zeros(self.n)
+        self.heating_power = np.zeros(self.n)
+
+    def set_fan_speed(self, speed):
+        self.fan_speed = np.clip(np.broadcast_to(speed, (self.n,)), 0, 1)
+
+    def set_heating_element(self, power):
+        self.heating_power = np.clip(np.broadcast_to(power, (self.n,)), 0, 1)
+
+    # Advance every roaster by one dt; returns (bean, env) arrays
+    def step(self):
+        self.bean_temperature, self.env_temperature, self.current_heating_power = thermal_step(
+            self.bean_temperature, self.env_temperature, self.current_heating_power,
+            self.heating_power, self.fan_speed, self.dt, **self.params,
+        )
+        return self.bean_temperature, self.env_temperature
+
+    # Run closed-loop roasts following target_temperatures, shaped (steps,)
+    # for one profile shared by all roasters or (steps, n) for one each.
+    # `controller` is one of the controllers in controllers.py (the
+    # proportional law by default); it sees every roaster as an array element.
+    # Returns a dict of (steps, n) arrays in control loop order: temperatures
+    # are read, then the controller output is applied for the next dt.
+    def run(self, target_temperatures, controller=None):
+        if controller is None:
+            controller = ProportionalController()
+        controller.reset()
+        targets = np.broadcast_to(np.asarray(target_temperatures, dtype=np.float64).reshape(len(target_temperatures), -1), (len(target_temperatures), self.n))
+        steps = len(targets)
+        target_slopes = np.gradient(targets, self.dt, axis=0) if steps > 1 else np.zeros_like(targets)
+        history = {name: np.empty((steps, self.n)) for name in ("bean_temperature", "env_temperature", "fan_speed", "heating_power")}
+        bean, env = self.bean_temperature, self.env_temperature
+        for i in range(steps):
+            fan_speed, heating_power = controller.update(targets[i], target_slopes[i], bean, env, self.dt)
+            self.set_fan_speed(fan_speed)
+            self.set_heating_element(heating_power)
+            history["bean_temperature"][i] = bean
+            history["env_temperature"][i] = env
+            history["fan_speed"][i] = self.fan_speed
+            history["heating_power"][i] = self.heating_power
+            bean, env = self.step()
+        history["target_temperature"] = np.array(targets)
+        history["time"] = np.arange(steps) * self.dt
+        return history
@@ -0,0 +1,61 @@
+import numpy as np
+
+#
+# Telemetry ring buffer
+#
+# Keeps the most recent `capacity` samples of the current roast in one
+# preallocated float64 array, so a client that connects late or reconnects
+# after a dropped connection can catch up from the last sequence number it
+# saw instead of reloading the whole log. Appending is a single row write;
+# nothing is allocated per sample.
+#
+# Sequence numbers keep counting across roasts and clear(), so a stale
+# `since` from a previous roast simply gets everything buffered.
+#
+RING_FIELDS = (
+    "time", "bean_temperature", "env_temperature", "target_temperature",
+    "fan_speed", "heating_power", "rate_of_rise",
+    "is_preheating", "is_roasting", "is_roast_completed",
+)
+_FLAG_FIELDS = {"is_preheating", "is_roasting", "is_roast_completed"}
+
+class SampleRing:
+    def __init__(self, capacity=7200):
+        self.capacity = capacity
+        self.values = np.zeros((capacity, len(RING_FIELDS)))
+        self.seqs = np.zeros(capacity, dtype=np.int64)
+        self.next_seq = 0
+        self.first_seq = 0
+
+    def __len__(self):
+        return self.next_seq - self.first_seq
+
+    # Store one sample frame; returns its sequence number
+    def append(self, frame):
+        seq = self.next_seq
+        slot = seq % self.capacity
+        self.values[slot] = [frame[name] for name in RING_FIELDS]
+        self.seqs[slot] = seq
+        self.next_seq += 1
+        self.first_seq = max(self.first_seq, self.next_seq - self.capacity)
+        return seq
+
+    # Forget the buffered samples, e.g. when a new roast starts
+    def clear(self):
+        self.first_seq = self.next_seq
+
+    # Buffered samples with a sequence number after `seq`, oldest first, as
+    # (seqs, {field: array}); the arrays are copies. None, a number older
+    # than the buffer, or one this process never issued (the server
+    # restarted) returns everything buffered.
+    def since(self, seq=None):
+        if seq is None or seq >= self.next_seq:
+            start = self.first_seq
+        else:
+            start = max(seq + 1, self.first_seq)
+        slots = np.arange(start, self.next_seq) % self.capacity
+        values = self.values[slots]
+        columns = {name: values[:, index] for index, name in enumerate(RING_FIELDS)}
+        for name in _FLAG_FIELDS:
+            columns[name] = columns[name].astype(bool)
+        return self.seqs[slots], columns
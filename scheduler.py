@@ -0,0 +1,156 @@
+import asyncio
+import bisect
+import threading
+import time
+from clock import RealClock
+
+#
+# Fixed-rate scheduling
+#
+# Periodic loops wait for absolute deadlines (start + n * period) instead of
+# sleeping a fixed time after their work, so the period doesn't stretch by
+# the work time and jitter doesn't accumulate. A loop that falls a whole
+# period or more behind counts an overrun and skips the missed deadlines
+# rather than bursting to catch up.
+#
+# Every ticker keeps TickStats: tick and overrun counts, worst lateness and
+# a histogram of how late each wakeup was.
+#
+
+# Histogram bucket upper bounds, in seconds
+JITTER_BUCKETS = (0.0001, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.5, float('inf'))
+
+class TickStats:
+    def __init__(self, period):
+        self.period = period
+        self.ticks = 0
+        self.overruns = 0
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+        self.histogram = [0] * len(JITTER_BUCKETS)
+
+    def record(self, lateness):
+        self.ticks += 1
+        self.total_lateness += lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        self.histogram[bisect.bisect_left(JITTER_BUCKETS, lateness)] += 1
+
+    @property
+    def summary(self):
+        return {
+            "period": self.period,
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "mean_lateness": self.total_lateness / self.ticks if self.ticks else 0.0,
+            "max_lateness": self.max_lateness,
+            "lateness_histogram": {
+                ("+Inf" if bound == float('inf') else f"{bound:g}"): count
+                for bound, count in zip(JITTER_BUCKETS, self.histogram)
+            },
+        }
+
+class _Deadlines:
+    def __init__(self, period, now):
+        self.period = period
+        self.stats = TickStats(period)
+        self.next_deadline = now + period
+
+    # Work out the next deadline after the current one was due at `now`
+    def advance(self, now):
+        deadline = self.next_deadline
+        if now - deadline >= self.period:
+            self.stats.overruns += 1
+            missed = int((now - deadline) / self.period)
+            deadline += missed * self.period
+        self.next_deadline = deadline + self.period
+        return deadline
+
+# For threads: time.monotonic() and time.sleep()
+class Ticker:
+    def __init__(self, period):
+        self._deadlines = _Deadlines(period, time.monotonic())
+
+    @property
+    def stats(self):
+        return self._deadlines.stats
+
+    # Sleep until the next deadline; returns how late the wakeup was
+    def wait(self):
+        deadline = self._deadlines.next_deadline
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        now = time.monotonic()
+        lateness = max(0.0, now - deadline)
+        self.stats.record(lateness)
+        self._deadlines.advance(now)
+        return lateness
+
+# For coroutines: any clock from clock.py (monotonic time by default)
+class AsyncTicker:
+    def __init__(self, period, clock=None):
+        self.clock = clock if clock is not None else RealClock()
+        self._deadlines = _Deadlines(period, self.clock.now())
+
+    @property
+    def stats(self):
+        return self._deadlines.stats
+
+    async def wait(self):
+        deadline = self._deadlines.next_deadline
+        await self.clock.sleep(deadline - self.clock.now())
+        now = self.clock.now()
+        lateness = max(0.0, now - deadline)
+        self.stats.record(lateness)
+        self._deadlines.advance(now)
+        return lateness
+
+#
+# Registry of named periodic tasks, each at its own rate, with their stats
+# in one place for reporting
+#
+class Scheduler:
+    def __init__(self):
+        self.tickers = {}
+
+    def ticker(self, name, period):
+        self.tickers[name] = Ticker(period)
+        return self.tickers[name]
+
+    def async_ticker(self, name, period, clock=None):
+        self.tickers[name] = AsyncTicker(period, clock)
+        return self.tickers[name]
+
+    # Call func() every `period` seconds on a daemon thread
+    def run_thread(self, name, period, func):
+        ticker = self.ticker(name, period)
+        def loop():
+            while True:
+                try:
+                    func()
+                except Exception as e:
+                    print(f"Periodic task {name} failed: {e}")
+                ticker.wait()
+        thread = threading.Thread(target=loop, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    # Await coroutine_func() every `period` clock seconds as an asyncio task
+    def run_task(self, name, period, coroutine_func, clock=None):
+        ticker = self.async_ticker(name, period, clock)
+        async def loop():
+            while True:
+                try:
+                    await coroutine_func()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Periodic task {name} failed: {e}")
+                await ticker.wait()
+        return asyncio.create_task(loop(), name=name)
+
+    def report(self):
+        return {name: ticker.stats.summary for name, ticker in self.tickers.items()}
+
+# Shared by everything in the process
+scheduler = Scheduler()
@@ -0,0 +1,174 @@
+import collections
+import math
+import statistics
+import time
+from metrics import registry
+from scheduler import scheduler
+
+#
+# Sensor acquisition
+#
+# Thermocouples are sampled on a background thread at SAMPLE_RATE, several
+# times per control tick, so the control loop never waits on the bus. Each
+# channel's samples go through
+#
+#   - a range check: readings outside valid_range (a disconnected or shorted
+#     thermocouple) are dropped and flagged
+#   - a running median over the last median_window good samples, which
+#     rejects single-sample spikes
+#   - a first-order low-pass with time_constant seconds
+#
+# Every sample produces an immutable SensorReading that replaces `latest` in
+# one attribute assignment, so readers on other threads take it without a
+# lock, and is appended to `history`, a bounded deque of the last
+# history_seconds.
+#
+# Per-channel flags mark readings that can't be trusted. A channel is stale
+# when it hasn't had a good sample for stale_after seconds; read_temperatures()
+# raises StaleReadingError rather than return a stale value.
+#
+SAMPLE_RATE = 20.0
+MEDIAN_WINDOW = 5
+TIME_CONSTANT = 0.25
+VALID_RANGE = (-20.0, 400.0)
+STALE_AFTER = 1.0
+HISTORY_SECONDS = 30.0
+
+SENSOR_STALE = 1
+SENSOR_OUT_OF_RANGE = 2
+SENSOR_READ_ERROR = 4
+_FLAG_NAMES = ((SENSOR_STALE, "stale"), (SENSOR_OUT_OF_RANGE, "out_of_range"), (SENSOR_READ_ERROR, "read_error"))
+
+def flag_names(flags):
+    return [name for bit, name in _FLAG_NAMES if flags & bit]
+
+# values are the filtered temperatures, raw the last samples as read, both
+# per channel; time is time.monotonic()
+SensorReading = collections.namedtuple("SensorReading", ("seq", "time", "values", "raw", "flags"))
+
+class StaleReadingError(RuntimeError):
+    pass
+
+class ChannelFilter:
+    def __init__(self, median_window=MEDIAN_WINDOW, time_constant=TIME_CONSTANT):
+        self.window = collections.deque(maxlen=median_window)
+        self.time_constant = time_constant
+        self.value = None
+        self.last_good = None
+
+    def update(self, sample, now, dt):
+        self.window.append(sample)
+        median = statistics.median(self.window)
+        if self.value is None or self.time_constant <= 0:
+            self.value = median
+        else:
+            self.value += (median - self.value) * dt / (self.time_constant + dt)
+        self.last_good = now
+        return self.value
+
+class SensorAcquisition:
+    # `read` returns one raw sample per channel, e.g. (bean, env)
+    def __init__(self, name, read, channels=("bean", "env"), rate=SAMPLE_RATE, median_window=MEDIAN_WINDOW,
+                 time_constant=TIME_CONSTANT, valid_range=VALID_RANGE, stale_after=STALE_AFTER,
+                 history_seconds=HISTORY_SECONDS):
+        self.name = name
+        self.read = read
+        self.channels = tuple(channels)
+        self.period = 1.0 / rate
+        self.valid_range = valid_range
+        self.stale_after = stale_after
+        self.filters = [ChannelFilter(median_window, time_constant) for _ in self.channels]
+        self.latest = None
+        self.history = collections.deque(maxlen=max(1, int(history_seconds * rate)))
+        self._seq = 0
+        self._last_sample = None
+        self._thread = None
+
+        self.read_timer = registry.histogram("roaster_sensor_read_seconds", "Time to read all thermocouples once", roaster=name)
+        self.read_errors = registry.counter("roaster_sensor_read_errors_total", "Failed thermocouple reads", roaster=name)
+        self.rejected = {
+            channel: registry.counter("roaster_sensor_rejected_samples_total", "Samples outside the valid range",
+                                      roaster=name, channel=channel)
+            for channel in self.channels
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = scheduler.run_thread(f"sensors-{self.name}", self.period, self.sample)
+
+    # Take and filter one sample of every channel; runs on the acquisition thread
+    def sample(self):
+        now = time.monotonic()
+        dt = now - self._last_sample if self._last_sample is not None else self.period
+        self._last_sample = now
+        error = 0
+        try:
+            with self.read_timer.time():
+                raw = tuple(float(value) for value in self.read())
+            if len(raw) != len(self.channels):
+                raise ValueError(f"expected {len(self.channels)} readings, got {len(raw)}")
+        except Exception:
+            self.read_errors.inc()
+            raw = (math.nan,) * len(self.channels)
+            error = SENSOR_READ_ERROR
+
+        low, high = self.valid_range
+        values = []
+        flags = []
+        for channel, channel_filter, sample in zip(self.channels, self.filters, raw):
+            channel_flags = error
+            if not error:
+                if math.isfinite(sample) and low <= sample <= high:
+                    channel_filter.update(sample, now, dt)
+                else:
+                    self.rejected[channel].inc()
+                    channel_flags |= SENSOR_OUT_OF_RANGE
+            if channel_filter.last_good is None or now - channel_filter.last_good > self.stale_after:
+                channel_flags |= SENSOR_STALE
+            values.append(channel_filter.value)
+            flags.append(channel_flags)
+
+        reading = SensorReading(self._seq, now, tuple(values), raw, tuple(flags))
+        self._seq += 1
+        self.history.append(reading)
+        self.latest = reading
+        return reading
+
+    # Latest filtered values, one per channel; raises StaleReadingError if
+    # acquisition has stopped or any channel is stale
+    def read_temperatures(self):
+        reading = self.latest
+        if reading is None:
+            raise StaleReadingError(f"No sensor readings yet from {self.name}")
+        if time.monotonic() - reading.time > self.stale_after:
+            raise StaleReadingError(f"Sensor acquisition for {self.name} stopped {time.monotonic() - reading.time:.1f}s ago")
+        stale = [channel for channel, flags in zip(self.channels, reading.flags) if flags & SENSOR_STALE]
+        if stale:
+            raise StaleReadingError(f"Stale sensor readings from {self.name}: {', '.join(stale)}")
+        return reading.values
+
+    # Latest reading and, with history > 0, up to that many recent samples
+    # as columns
+    def report(self, history=0):
+        reading = self.latest
+        report = {
+            "rate": 1.0 / self.period,
+            "latest": None if reading is None else {
+                "seq": reading.seq,
+                "age": time.monotonic() - reading.time,
+                "channels": {
+                    channel: {"value": value, "raw": raw if math.isfinite(raw) else None, "flags": flag_names(flags)}
+                    for channel, value, raw, flags in zip(self.channels, reading.values, reading.raw, reading.flags)
+                },
+            },
+        }
+        if history > 0:
+            # list() copies the deque in one step, so it's safe while the
+            # acquisition thread appends
+            readings = list(self.history)[-history:]
+            report["history"] = {
+                "time": [reading.time for reading in readings],
+                **{channel: [reading.values[index] for reading in readings] for index, channel in enumerate(self.channels)},
+                "flags": [list(reading.flags) for reading in readings],
+            }
+        return report
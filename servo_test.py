@@ -1,14 +1,9 @@
 import maestro
 import time
-import matplotlib.pyplot as plt
+from scheduler import Ticker
 
-servo = maestro.Controller()
 servo_channel = 0  # Assuming we're using the first servo channel
 
-# Set acceleration and speed
-servo.setAccel(servo_channel, 4)  # Set servo acceleration to 4
-servo.setSpeed(servo_channel, 10)  # Set servo speed to 10
-
 # Servo Configuration
 SERVO_CHANNEL = 0
 SERVO_ACCELERATION = 4
@@ -16,8 +11,10 @@ SERVO_SPEED = 10
 MIN_PULSE = 4000
 MAX_PULSE = 8000
 STEP_SIZE = 100
+POLL_PERIOD = 0.01  # Sample the position on a fixed 100 Hz grid
 
-servo = maestro.Controller()
+# Retries while the Maestro is still enumerating
+servo = maestro.openController()
 
 # Set acceleration and speed
 servo.setAccel(SERVO_CHANNEL, SERVO_ACCELERATION)
@@ -35,6 +32,7 @@ for pulse in range(MIN_PULSE, MAX_PULSE + 1, STEP_SIZE):
     print(f"Setting servo position to: {pulse}")
     
     # Wait for the servo to reach the position
+    poll = Ticker(POLL_PERIOD)
     while abs(servo.getPosition(servo_channel) - pulse) > 10:  # Tolerance of 10
         current_position = servo.getPosition(servo_channel)
         print(f"Current position: {current_position}")
@@ -44,7 +42,7 @@ for pulse in range(MIN_PULSE, MAX_PULSE + 1, STEP_SIZE):
         actual_positions.append(current_position)
         timestamps.append(time.time() - start_time)
         
-        time.sleep(0.01)
+        poll.wait()
     
     # Record final position for this step
     current_position = servo.getPosition(servo_channel)
@@ -60,6 +58,7 @@ servo.setTarget(servo_channel, center_pulse)
 print("Returning to center position")
 
 # Wait for the servo to reach the center position
+poll = Ticker(POLL_PERIOD)
 while abs(servo.getPosition(servo_channel) - center_pulse) > 10:
     current_position = servo.getPosition(servo_channel)
     
@@ -67,7 +66,7 @@ while abs(servo.getPosition(servo_channel) - center_pulse) > 10:
     actual_positions.append(current_position)
     timestamps.append(time.time() - start_time)
     
-    time.sleep(0.01)
+    poll.wait()
 
 # Get final position
 final_position = servo.getPosition(servo_channel)
@@ -80,13 +79,19 @@ timestamps.append(time.time() - start_time)
 
 servo.close()
 
-# Plot the results
-plt.figure(figsize=(10, 6))
-plt.plot(timestamps, desired_positions, label='Desired Position')
-plt.plot(timestamps, actual_positions, label='Actual Position')
-plt.xlabel('Time (seconds)')
-plt.ylabel('Servo Position')
-plt.title('Servo Position vs Time')
-plt.legend()
-plt.grid(True)
-plt.show()
\ No newline at end of file
+# Plot the results. matplotlib is slow to import, so it is only loaded once
+# the servo run is over.
+def plot_results(timestamps, desired_positions, actual_positions):
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(10, 6))
+    plt.plot(timestamps, desired_positions, label='Desired Position')
+    plt.plot(timestamps, actual_positions, label='Actual Position')
+    plt.xlabel('Time (seconds)')
+    plt.ylabel('Servo Position')
+    plt.title('Servo Position vs Time')
+    plt.legend()
+    plt.grid(True)
+    plt.show()
+
+plot_results(timestamps, desired_positions, actual_positions)
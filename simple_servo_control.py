@@ -1,15 +1,28 @@
+from startup_timing import STARTUP_SORT_KEYS, timeline  # first, so every later import is timed
+import asyncio
+import os
+from contextlib import asynccontextmanager
 import maestro
-from fastapi import FastAPI, WebSocket
-from fastapi.responses import FileResponse
+from static_assets import StaticAsset
+from trajectory import TrajectoryPlayer, precompute
+from scheduler import AsyncTicker, scheduler
+from metrics import registry
+from fastapi import FastAPI, HTTPException, Request, WebSocket
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
-import threading
-import time
 import uvicorn
 import numpy as np
-import asyncio
 import json
 
-app = FastAPI()
+timeline.mark("imports")
+
+# Startup; open_maestro is defined further down
+@asynccontextmanager
+async def lifespan(app):
+    await open_maestro()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 # Serve static files (for the plot)
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -22,97 +35,132 @@ SERVO_ACCELERATION = 4
 SERVO_SPEED = 10
 MIN_PULSE = 4000
 MAX_PULSE = 8000
+# All channel positions are polled together this often and shared by every
+# dashboard
+TELEMETRY_PERIOD = 0.1
+# Curves repeat every PROFILE_DURATION seconds; the wind-up sweep every
+# WIND_UP_PERIOD seconds
+PROFILE_DURATION = 600  # 10 minutes
+WIND_UP_PERIOD = 60.8
+CURVE_RESOLUTION = 0.1
+WIND_UP_RESOLUTION = 0.01
 
-servo = maestro.Controller()
+# Opened by the startup hook, not at import, so the process comes up (and
+# retries) while the Maestro is still enumerating
+servo = None
+MAESTRO_OPEN_ATTEMPTS = 10
+MAESTRO_RETRY_DELAY = 0.5
 
-# Set acceleration and speed for all servos
-for channel in [WIND_UP_SERVO, POWER_SERVO, FAN_SERVO]:
-    servo.setAccel(channel, SERVO_ACCELERATION)
-    servo.setSpeed(channel, SERVO_SPEED)
-
-# Hardcoded curves for power and fan
+# Hardcoded curves for power and fan, vectorized over arrays of times
 def power_curve(t):
-    return int(MIN_PULSE + (MAX_PULSE - MIN_PULSE) * (np.sin(t / 30) + 1) / 2)
+    return MIN_PULSE + (MAX_PULSE - MIN_PULSE) * (np.sin(t / 30) + 1) / 2
 
 def fan_curve(t):
-    return int(MIN_PULSE + (MAX_PULSE - MIN_PULSE) * (np.cos(t / 20) + 1) / 2)
+    return MIN_PULSE + (MAX_PULSE - MIN_PULSE) * (np.cos(t / 20) + 1) / 2
+
+# Sweep min to max and back in steps of 100 every 10 ms, then rest for a
+# minute before the next wind-up
+def wind_up_curve(t):
+    sweep = (MAX_PULSE - MIN_PULSE) / 100 * 0.01
+    cycle_time = np.floor(np.mod(t, WIND_UP_PERIOD) / 0.01) * 0.01
+    return np.interp(cycle_time, [0, sweep, 2 * sweep, WIND_UP_PERIOD], [MIN_PULSE, MAX_PULSE, MIN_PULSE, MIN_PULSE])
+
+# One thread plays every channel from precomputed tables; it gets the servo
+# once the Maestro is open
+player = TrajectoryPlayer(None, tick=WIND_UP_RESOLUTION)
+player.add_track(WIND_UP_SERVO, wind_up_curve, WIND_UP_PERIOD, WIND_UP_RESOLUTION, MIN_PULSE, MAX_PULSE)
+player.add_track(POWER_SERVO, power_curve, PROFILE_DURATION, CURVE_RESOLUTION, MIN_PULSE, MAX_PULSE)
+player.add_track(FAN_SERVO, fan_curve, PROFILE_DURATION, CURVE_RESOLUTION, MIN_PULSE, MAX_PULSE)
 
 # Generate the entire profile
 def generate_profile():
-    total_time = 600  # 10 minutes
-    time_points = np.linspace(0, total_time, num=int(total_time)+1)
-    power_profile = [power_curve(t) for t in time_points]
-    fan_profile = [fan_curve(t) for t in time_points]
+    time_points = np.linspace(0, PROFILE_DURATION, num=int(PROFILE_DURATION)+1)
     return {
         "time": time_points.tolist(),
-        "power": power_profile,
-        "fan": fan_profile
+        "power": precompute(power_curve, PROFILE_DURATION, 1.0, MIN_PULSE, MAX_PULSE).tolist(),
+        "fan": precompute(fan_curve, PROFILE_DURATION, 1.0, MIN_PULSE, MAX_PULSE).tolist()
     }
 
 profile = generate_profile()
 
-def wind_up_action():
-    while True:
-        # Move from min to max
-        for pulse in range(MIN_PULSE, MAX_PULSE, 100):
-            servo.setTarget(WIND_UP_SERVO, pulse)
-            time.sleep(0.01)
-        # Move from max to min
-        for pulse in range(MAX_PULSE, MIN_PULSE, -100):
-            servo.setTarget(WIND_UP_SERVO, pulse)
-            time.sleep(0.01)
-        time.sleep(60)  # Wait for 1 minute before next wind-up action
-
-def control_servo(servo_id, curve_func):
-    start_time = time.time()
-    while True:
-        elapsed_time = time.time() - start_time
-        if elapsed_time > 600:  # Reset after 10 minutes
-            start_time = time.time()
-            elapsed_time = 0
-        
-        desired_position = curve_func(elapsed_time)
-        desired_position = max(MIN_PULSE, min(MAX_PULSE, desired_position))
-        servo.setTarget(servo_id, desired_position)
-        
-        time.sleep(0.1)
+async def open_maestro():
+    global servo
+    servo = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: maestro.openController(attempts=MAESTRO_OPEN_ATTEMPTS, retryDelay=MAESTRO_RETRY_DELAY))
+    timeline.mark("hardware")
+
+    # Set acceleration and speed for all servos
+    for channel in [WIND_UP_SERVO, POWER_SERVO, FAN_SERVO]:
+        servo.setAccel(channel, SERVO_ACCELERATION)
+        servo.setSpeed(channel, SERVO_SPEED)
+
+    servo.startTelemetry([WIND_UP_SERVO, POWER_SERVO, FAN_SERVO], TELEMETRY_PERIOD)
+    player.servo = servo
+    player.start()
+    timeline.ready()
+
+# Served from memory, precompressed and revalidated with ETag/Last-Modified;
+# DEV_MODE=1 reloads the page whenever the file changes
+DEV_MODE = os.environ.get("DEV_MODE", "") not in ("", "0")
+servo_page = StaticAsset("simple-servo-control.html", "text/html; charset=utf-8", reload=DEV_MODE)
 
 @app.get("/")
-async def index():
-    return FileResponse("simple-servo-control.html")
+async def index(request: Request):
+    return servo_page.response(request)
+
+# Per-loop tick counts, overruns and lateness histograms
+@app.get("/debug/scheduler")
+async def get_scheduler_stats():
+    return scheduler.report()
+
+# Time from process start to playback running, with a per-module import
+# breakdown (?sort=cumulative|self|order&limit=N)
+@app.get("/debug/startup")
+async def debug_startup(sort: str = "cumulative", limit: int = 30):
+    if sort not in STARTUP_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort key '{sort}', expected one of {', '.join(STARTUP_SORT_KEYS)}")
+    return timeline.report(sort, limit)
+
+# Prometheus scrape target: Maestro write and round-trip times, scheduler lateness
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     await websocket.send_json({"profile": profile})
     
+    ticker = AsyncTicker(0.1)
     try:
-        start_time = time.time()
         while True:
-            current_time = time.time() - start_time
-            if current_time > 600:
-                start_time = time.time()
-                current_time = 0
+            # Time on the player's clock, so the chart lines up with playback
+            current_time = player.elapsed % PROFILE_DURATION
             
-            wind_up_position = servo.getPosition(WIND_UP_SERVO)
-            power_position = servo.getPosition(POWER_SERVO)
-            fan_position = servo.getPosition(FAN_SERVO)
+            # One consistent snapshot of all channels from the shared poller.
+            # If the poller has stalled, ask the Maestro directly rather than
+            # show frozen positions; a channel that can't be read is sent as
+            # missing.
+            positions = servo.telemetry.cachedPositions([WIND_UP_SERVO, POWER_SERVO, FAN_SERVO])
+            for chan, position in positions.items():
+                if position is None:
+                    try:
+                        positions[chan] = await servo.getPositionAsync(chan)
+                    except (TimeoutError, OSError):
+                        pass
             
             await websocket.send_json({
                 "time": current_time,
-                "wind_up": wind_up_position,
-                "power": power_position,
-                "fan": fan_position
+                "wind_up": positions.get(WIND_UP_SERVO),
+                "power": positions.get(POWER_SERVO),
+                "fan": positions.get(FAN_SERVO)
             })
             
-            await asyncio.sleep(0.1)
+            await ticker.wait()
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
         await websocket.close()
 
 if __name__ == '__main__':
-    threading.Thread(target=wind_up_action, daemon=True).start()
-    threading.Thread(target=control_servo, args=(POWER_SERVO, power_curve), daemon=True).start()
-    threading.Thread(target=control_servo, args=(FAN_SERVO, fan_curve), daemon=True).start()
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
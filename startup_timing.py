@@ -0,0 +1,158 @@
+import importlib.machinery
+import os
+import sys
+import threading
+import time
+
+#
+# Startup timing
+#
+# How long a restart takes before the control loop is back, broken down like
+# `python -X importtime` but available from the running server. Importing
+# this module installs an import hook that times every module executed after
+# it, so the apps import it before anything else. They then mark() the
+# milestones of their startup ("imports", "hardware", "ready", ...) and serve
+# report() at /debug/startup.
+#
+# Imports that finish after the "ready" mark are reported as deferred: they
+# were kept off the critical path (e.g. scipy, which is imported on first use
+# and warmed in the background).
+#
+
+# Seconds from process start to "ready" we aim to stay under
+STARTUP_TARGET = float(os.environ.get("STARTUP_TARGET", "2.0"))
+
+STARTUP_SORT_KEYS = ("cumulative", "self", "order")
+
+# Seconds the process had been running before this module was imported
+# (interpreter startup and site imports), from /proc where available
+def _process_age():
+    try:
+        with open("/proc/self/stat") as file:
+            # Fields after the parenthesised command name; starttime is field 22
+            fields = file.read().rpartition(")")[2].split()
+        with open("/proc/uptime") as file:
+            uptime = float(file.read().split()[0])
+        return max(0.0, uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+_FILE_LOADERS = (
+    importlib.machinery.SourceFileLoader,
+    importlib.machinery.SourcelessFileLoader,
+    importlib.machinery.ExtensionFileLoader,
+)
+
+class ImportTimer:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        # (module, self, cumulative, depth, at) in completion order
+        self.imports = []
+        self._local = threading.local()
+
+    # Meta path finder: let the regular finders locate the module, then time
+    # the loader's exec_module. Only file loaders are wrapped; they are created
+    # per module, so the wrapper never stacks.
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if isinstance(spec.loader, _FILE_LOADERS):
+            spec.loader.exec_module = self._timed(name, spec.loader.exec_module)
+        return spec
+
+    def _timed(self, name, exec_module):
+        def timed_exec_module(module):
+            # Nested imports run inside this one; their time is subtracted
+            # from this module's self time
+            stack = self._local.__dict__.setdefault("stack", [])
+            stack.append(0.0)
+            start = self.clock()
+            try:
+                exec_module(module)
+            finally:
+                cumulative = self.clock() - start
+                children = stack.pop()
+                if stack:
+                    stack[-1] += cumulative
+                self.imports.append((name, cumulative - children, cumulative, len(stack), start - self.started))
+        return timed_exec_module
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+class StartupTimeline:
+    def __init__(self, target=STARTUP_TARGET):
+        self.target = target
+        self.before_import = _process_age()
+        self.import_timer = ImportTimer()
+        self.started = self.import_timer.started
+        self.marks = {}
+
+    # Record a milestone, in seconds since this module was imported
+    def mark(self, name):
+        self.marks[name] = time.perf_counter() - self.started
+        return self.marks[name]
+
+    # Mark the end of startup and warn when it took longer than the target
+    def ready(self):
+        self.mark("ready")
+        elapsed = self.elapsed("ready")
+        if elapsed > self.target:
+            print(f"Startup took {elapsed:.2f}s, over the {self.target:.2f}s target; see /debug/startup")
+        return elapsed
+
+    # From process start when known, otherwise from this module's import
+    def elapsed(self, name):
+        if name not in self.marks:
+            return None
+        return self.marks[name] + (self.before_import or 0.0)
+
+    def report(self, sort="cumulative", limit=30):
+        if sort not in STARTUP_SORT_KEYS:
+            raise ValueError(f"Unknown sort '{sort}', expected one of {', '.join(STARTUP_SORT_KEYS)}")
+        ready = self.marks.get("ready")
+        imports = list(self.import_timer.imports)
+        top_level = [entry for entry in imports if entry[3] == 0]
+        critical = [entry for entry in top_level if ready is None or entry[4] + entry[2] <= ready]
+        if sort != "order":
+            imports.sort(key=lambda entry: entry[1 if sort == "self" else 2], reverse=True)
+        ready_elapsed = self.elapsed("ready")
+        return {
+            "target": self.target,
+            "ready": ready_elapsed,
+            "within_target": None if ready_elapsed is None else ready_elapsed <= self.target,
+            "before_import": self.before_import,
+            "marks": dict(self.marks),
+            "imports": {
+                "count": len(imports),
+                "critical_path": sum(entry[2] for entry in critical),
+                "deferred": sum(entry[2] for entry in top_level) - sum(entry[2] for entry in critical),
+                "modules": [
+                    {
+                        "module": name,
+                        "self": self_time,
+                        "cumulative": cumulative,
+                        "depth": depth,
+                        "at": at,
+                        "deferred": ready is not None and at + cumulative > ready,
+                    }
+                    for name, self_time, cumulative, depth, at in imports[:limit]
+                ],
+            },
+        }
+
+# Shared by everything in the process
+timeline = StartupTimeline()
+timeline.import_timer.install()
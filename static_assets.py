@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # optional, only adds the br encoding
+    brotli = None
+
+#
+# Cached static assets
+#
+# A UI page is read from disk once and kept in memory together with gzip (and,
+# when the brotli package is installed, brotli) variants compressed at the
+# highest level, since that cost is paid only once. Each request is answered
+# from memory:
+#
+#   - the variant the client's Accept-Encoding rates highest is sent, the
+#     smallest one on a tie, or 406 if none is acceptable
+#   - ETag and Last-Modified let browsers revalidate; a matching
+#     If-None-Match (or, without one, an If-Modified-Since no older than the
+#     file) gets an empty 304
+#   - Cache-Control: no-cache makes browsers revalidate on every load, so an
+#     updated page shows up at once while an unchanged one costs one 304
+#
+# With reload=True (dev mode) the file's mtime is checked on each request and
+# the asset is reloaded when it changes; otherwise the disk is never touched
+# again after the first request.
+#
+
+# Preferred first when the client accepts several equally
+ENCODINGS = ("br", "gzip", "identity")
+
+def _compress(body):
+    variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    # A variant that doesn't save anything isn't worth sending
+    return {encoding: data for encoding, data in variants.items() if encoding == "identity" or len(data) < len(body)}
+
+# Encodings from an Accept-Encoding header with their q values
+def _accepted_encodings(header):
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+class StaticAsset:
+    def __init__(self, path, media_type=None, reload=False):
+        self.path = path
+        self.media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.reload = reload
+        self.mtime = None
+        self.variants = {}
+        self.etags = {}
+        self.last_modified = None
+
+    def load(self):
+        with open(self.path, "rb") as file:
+            mtime = os.fstat(file.fileno()).st_mtime
+            body = file.read()
+        self.variants = _compress(body)
+        digest = hashlib.sha1(body).hexdigest()[:16]
+        # Each encoding is a different representation, so each gets its own tag
+        self.etags = {encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"' for encoding in self.variants}
+        self.last_modified = formatdate(mtime, usegmt=True)
+        self.mtime = mtime
+
+    def _current(self):
+        if self.mtime is None or (self.reload and os.stat(self.path).st_mtime != self.mtime):
+            self.load()
+
+    # The acceptable encoding with the highest q value, ties going to the
+    # smaller variant (ENCODINGS order); None if nothing we have is acceptable.
+    # identity is acceptable unless excluded explicitly or by "*;q=0".
+    def _choose_encoding(self, accept_encoding):
+        if accept_encoding is None:
+            return "identity"
+        accepted = _accepted_encodings(accept_encoding)
+        def quality(encoding):
+            if encoding in accepted:
+                return accepted[encoding]
+            return accepted.get("*", 1.0 if encoding == "identity" else 0.0)
+        candidates = [(quality(encoding), -rank, encoding) for rank, encoding in enumerate(ENCODINGS) if encoding in self.variants]
+        q, _, encoding = max(candidates)
+        return encoding if q > 0 else None
+
+    # Conditional request check against the representation being served
+    def _not_modified(self, request, encoding):
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in tags or self.etags[encoding] in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= int(self.mtime)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def response(self, request: Request):
+        self._current()
+        encoding = self._choose_encoding(request.headers.get("accept-encoding"))
+        if encoding is None:
+            return Response(f"No acceptable encoding; available: {', '.join(self.variants)}", status_code=406,
+                            media_type="text/plain", headers={"Vary": "Accept-Encoding"})
+        headers = {
+            "ETag": self.etags[encoding],
+            "Last-Modified": self.last_modified,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if self._not_modified(request, encoding):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=self.variants[encoding], media_type=self.media_type, headers=headers)
@@ -0,0 +1,225 @@
+import argparse
+import glob
+import json
+import os
+import numpy as np
+from scipy.optimize import minimize
+from roast_log import read_log
+from roaster_sim import DEFAULT_THERMAL_PARAMS, thermal_step
+
+#
+# Thermal model identification
+#
+# Fits the SimulatedRoaster parameters to recorded roasts. Each log row holds
+# the temperatures read at one tick and the fan/heater commands applied until
+# the next, so consecutive rows give one-step transitions of thermal_step:
+#
+#   h[k+1]   = h[k] + (heat[k] - h[k]) * dt / heating_lag
+#   env[k+1] = env[k] + heating_efficiency * h[k+1] * dt
+#              - min(max_cooling_rate, (exp((env[k] - ambient) / cooling_scale) - 1) * (1 + fan[k])) * dt
+#   bean[k+1] = bean[k] + bean_coupling * (env[k+1] - bean[k]) * dt
+#
+# heating_efficiency and bean_coupling enter linearly, so for any choice of
+# the other three they have closed-form least-squares solutions. The
+# nonlinear parameters (heating_lag, cooling_scale, max_cooling_rate) are
+# grid-searched with the residuals of every transition from every log
+# evaluated as one array, then polished with Nelder-Mead. ambient_temperature
+# is taken as given.
+#
+# While the environment sits above the cooling cap the fit only sees
+# max_cooling_rate; cooling_scale is then poorly determined, which matters
+# little since the simulator behaves the same.
+#
+# The result is written as a parameter file that SimulatedRoaster loads
+# (see roaster_sim.load_thermal_params):
+#
+#   python system_id.py roast_logs/*.csv --output sim_params/default.json
+#
+
+HEATING_LAGS = np.linspace(0.5, 20.0, 40)
+COOLING_SCALES = np.geomspace(20.0, 500.0, 40)
+MAX_COOLING_RATES = np.geomspace(0.5, 50.0, 30)
+
+# Transitions with the environment this close to ambient may have been
+# clamped by the model and are left out of the env fit
+AMBIENT_MARGIN = 1.0
+
+# The heater state at the first sample is unknown, so the env fit skips the
+# start of every log while a wrong initial guess dies out
+SETTLE_TIME = 60.0
+
+# Load logs as contiguous float64 arrays of the columns the fit needs
+def load_logs(paths, roaster_id=None):
+    logs = []
+    for path in paths:
+        header, data = read_log(path, {"Time", "Bean_Temperature", "Environment_Temperature", "Fan_Speed", "Heating_Power"})
+        if roaster_id is not None and (header.get("metadata") or {}).get("roaster_id", "default") != roaster_id:
+            continue
+        if len(data.get("Time", ())) < 3:
+            continue
+        logs.append({
+            "path": path,
+            "time": np.asarray(data["Time"], dtype=np.float64),
+            "bean": np.asarray(data["Bean_Temperature"], dtype=np.float64),
+            "env": np.asarray(data["Environment_Temperature"], dtype=np.float64),
+            "fan": np.asarray(data["Fan_Speed"], dtype=np.float64),
+            "heat": np.asarray(data["Heating_Power"], dtype=np.float64),
+        })
+    return logs
+
+# Lagged heater state for each log and each candidate lag: (lags, transitions)
+# with every log's transitions concatenated. The state starts at the first
+# logged command, since roasts start from a steady preheat.
+def lagged_heating(logs, heating_lags):
+    heating_lags = np.asarray(heating_lags, dtype=np.float64)
+    states = []
+    for log in logs:
+        dt = np.diff(log["time"])
+        h = np.full(len(heating_lags), log["heat"][0])
+        log_states = np.empty((len(heating_lags), len(dt)))
+        for k in range(len(dt)):
+            h = h + (log["heat"][k] - h) * dt[k] / heating_lags
+            log_states[:, k] = h
+        states.append(log_states)
+    return np.concatenate(states, axis=1)
+
+# All one-step transitions of all logs as flat arrays
+def transitions(logs):
+    def stack(key, part):
+        return np.concatenate([log[key][:-1] if part == "now" else log[key][1:] for log in logs])
+    dt = np.concatenate([np.diff(log["time"]) for log in logs])
+    return {
+        "dt": dt,
+        "elapsed": np.concatenate([log["time"][:-1] - log["time"][0] for log in logs]),
+        "bean": stack("bean", "now"),
+        "next_bean": stack("bean", "next"),
+        "env": stack("env", "now"),
+        "next_env": stack("env", "next"),
+        "fan": stack("fan", "now"),
+    }
+
+def _env_mask(data, ambient):
+    return (data["env"] > ambient + AMBIENT_MARGIN) & (data["elapsed"] >= SETTLE_TIME)
+
+# Closed-form heating_efficiency and its squared error for every combination
+# of the given heater states (L, N), cooling scales (S) and caps (M); returns
+# (efficiency, sse) shaped (L, S, M)
+def _fit_efficiency(data, heating, cooling_scales, max_cooling_rates, ambient):
+    mask = _env_mask(data, ambient)
+    rate = ((data["next_env"] - data["env"]) / data["dt"])[mask]
+    heating = heating[:, mask]
+    cooling_factor = np.exp((data["env"][mask] - ambient) / np.asarray(cooling_scales)[:, None]) - 1
+    cooling_factor *= 1 + data["fan"][mask]
+
+    hh = np.einsum("ln,ln->l", heating, heating)
+    efficiency = np.empty((len(heating), len(cooling_scales), len(max_cooling_rates)))
+    sse = np.empty_like(efficiency)
+    for m, max_cooling_rate in enumerate(max_cooling_rates):
+        # env rate + cooling = efficiency * heating
+        target = rate + np.minimum(max_cooling_rate, cooling_factor)  # (S, N)
+        ht = heating @ target.T  # (L, S)
+        tt = np.einsum("sn,sn->s", target, target)
+        eff = np.where(hh[:, None] > 0, ht / np.where(hh > 0, hh, 1)[:, None], 0.0)
+        efficiency[:, :, m] = eff
+        sse[:, :, m] = tt[None, :] - 2 * eff * ht + eff ** 2 * hh[:, None]
+    return efficiency, sse
+
+def _fit_bean_coupling(data):
+    x = data["next_env"] - data["bean"]
+    y = (data["next_bean"] - data["bean"]) / data["dt"]
+    coupling = float(np.dot(x, y) / np.dot(x, x))
+    return coupling, float(np.sqrt(np.mean((y - coupling * x) ** 2)))
+
+# Replay every log's commands through the fitted model from its first
+# sample, all logs stepping together; returns per-log bean and env RMSE
+def free_run_rmse(logs, params):
+    length = max(len(log["time"]) for log in logs)
+    def padded(key):
+        values = np.full((length, len(logs)), np.nan)
+        for i, log in enumerate(logs):
+            values[:len(log[key]), i] = log[key]
+        return values
+    time, bean_log, env_log, fan, heat = (padded(key) for key in ("time", "bean", "env", "fan", "heat"))
+    dt = np.nan_to_num(np.diff(time, axis=0))
+    bean, env, h = bean_log[0].copy(), env_log[0].copy(), heat[0].copy()
+    bean_sim = np.full_like(bean_log, np.nan)
+    env_sim = np.full_like(env_log, np.nan)
+    bean_sim[0], env_sim[0] = bean, env
+    for k in range(length - 1):
+        bean, env, h = thermal_step(bean, env, h, np.nan_to_num(heat[k]), np.nan_to_num(fan[k]), dt[k], **params)
+        bean_sim[k + 1], env_sim[k + 1] = bean, env
+    bean_rmse = np.sqrt(np.nanmean((bean_sim - bean_log) ** 2, axis=0))
+    env_rmse = np.sqrt(np.nanmean((env_sim - env_log) ** 2, axis=0))
+    return bean_rmse, env_rmse
+
+def fit_thermal_params(logs, ambient_temperature=DEFAULT_THERMAL_PARAMS["ambient_temperature"],
+                       heating_lags=HEATING_LAGS, cooling_scales=COOLING_SCALES, max_cooling_rates=MAX_COOLING_RATES):
+    if not logs:
+        raise ValueError("No usable roast logs to fit")
+    data = transitions(logs)
+    if not np.any(_env_mask(data, ambient_temperature)):
+        raise ValueError("Logs never heat above ambient after settling; nothing to fit")
+
+    # Coarse grid over the nonlinear parameters
+    _, sse = _fit_efficiency(data, lagged_heating(logs, heating_lags), cooling_scales, max_cooling_rates, ambient_temperature)
+    lag_index, scale_index, cap_index = np.unravel_index(np.argmin(sse), sse.shape)
+    best = np.log([heating_lags[lag_index], cooling_scales[scale_index], max_cooling_rates[cap_index]])
+
+    # Polish in log space, which keeps every parameter positive
+    def objective(log_params):
+        heating_lag, cooling_scale, max_cooling_rate = np.exp(log_params)
+        _, point_sse = _fit_efficiency(data, lagged_heating(logs, [heating_lag]), [cooling_scale], [max_cooling_rate], ambient_temperature)
+        return float(point_sse[0, 0, 0])
+    result = minimize(objective, best, method="Nelder-Mead", options={"xatol": 1e-4, "fatol": 1e-9, "maxiter": 400})
+    heating_lag, cooling_scale, max_cooling_rate = np.exp(result.x if result.fun <= sse[lag_index, scale_index, cap_index] else best)
+    point_efficiency, point_sse = _fit_efficiency(data, lagged_heating(logs, [heating_lag]), [cooling_scale], [max_cooling_rate], ambient_temperature)
+    bean_coupling, bean_rate_rmse = _fit_bean_coupling(data)
+
+    params = {
+        "heating_lag": float(heating_lag),
+        "heating_efficiency": float(point_efficiency[0, 0, 0]),
+        "max_cooling_rate": float(max_cooling_rate),
+        "ambient_temperature": float(ambient_temperature),
+        "bean_coupling": bean_coupling,
+        "cooling_scale": float(cooling_scale),
+    }
+    env_samples = int(np.sum(_env_mask(data, ambient_temperature)))
+    bean_rmse, env_rmse = free_run_rmse(logs, params)
+    fit = {
+        "logs": [log["path"] for log in logs],
+        "transitions": len(data["dt"]),
+        "env_rate_rmse": float(np.sqrt(point_sse[0, 0, 0] / env_samples)),
+        "bean_rate_rmse": bean_rate_rmse,
+        "free_run_bean_rmse": bean_rmse.tolist(),
+        "free_run_env_rmse": env_rmse.tolist(),
+    }
+    return params, fit
+
+def log_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.csv")
+        paths.extend(sorted(glob.glob(pattern)))
+    return paths
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fit SimulatedRoaster parameters to roast logs")
+    parser.add_argument("logs", nargs="*", default=["roast_logs"], help="log files, globs or directories (default: roast_logs)")
+    parser.add_argument("--roaster", help="only use logs recorded on this roaster ID")
+    parser.add_argument("--ambient", type=float, default=DEFAULT_THERMAL_PARAMS["ambient_temperature"], help="ambient temperature")
+    parser.add_argument("--output", help="parameter file to write (default: sim_params/<roaster or default>.json)")
+    args = parser.parse_args()
+
+    logs = load_logs(log_paths(args.logs), args.roaster)
+    params, fit = fit_thermal_params(logs, args.ambient)
+    output = args.output or os.path.join("sim_params", f"{args.roaster or 'default'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as file:
+        json.dump({"params": params, "fit": fit}, file, indent=2)
+
+    print(f"Fitted {len(logs)} logs, {fit['transitions']} transitions -> {output}")
+    for name, value in params.items():
+        print(f"  {name:<20} {value:.4f}")
+    print(f"  one-step rate RMSE   env {fit['env_rate_rmse']:.4f}, bean {fit['bean_rate_rmse']:.4f} degrees/s")
+    print(f"  free-run bean RMSE   {np.mean(fit['free_run_bean_rmse']):.3f} degrees (mean over logs)")
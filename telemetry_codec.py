@@ -0,0 +1,142 @@
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:  # optional, only needed for ?format=msgpack
+    msgpack = None
+
+#
+# WebSocket telemetry encodings
+#
+# Clients pick an encoding when they connect (/ws?format=...&batch=N).
+#
+#   json     (default) one JSON text frame per sample, exactly as before; with
+#            batch > 1 a JSON array of samples per frame
+#   binary   samples packed as little-endian structs in binary frames:
+#              uint8 type (1), uint16 count, then per sample
+#              uint32 seq, float32 time, bean, env, target, fan, heat,
+#              rate_of_rise and uint8 flags (1 preheating, 2 roasting,
+#              4 roast completed)
+#            33 bytes per sample instead of ~300. Events and other control
+#            messages go out as JSON text frames, events only when they
+#            change.
+#   msgpack  binary frames holding a msgpack array of samples, each a map
+#            of its seq ("n") plus, under short keys, only the fields that
+#            changed since the client's previous sample (the first sample is
+#            complete). Control messages are msgpack maps with their usual
+#            keys.
+#
+# In batched mode up to `batch` samples share one frame. Control messages
+# and idle periods flush a partial batch, so nothing is held back.
+#
+# A backfill of buffered samples (see sample_ring.py) goes out before any
+# live frames: one {"backfill": {"seq": [...], "time": [...], ...}} JSON
+# object of columns in json mode, and ordinary sample frames otherwise.
+#
+FORMATS = ("json", "binary", "msgpack")
+
+SAMPLES_FRAME = 1
+_BATCH_HEADER = struct.Struct("<BH")
+_SAMPLE = struct.Struct("<I7fB")
+_MAX_BATCH = 0xffff
+
+# Sample keys, their short msgpack names, and the order they're packed in
+SAMPLE_FIELDS = (
+    ("time", "t"),
+    ("bean_temperature", "b"),
+    ("env_temperature", "e"),
+    ("target_temperature", "g"),
+    ("fan_speed", "f"),
+    ("heating_power", "h"),
+    ("rate_of_rise", "r"),
+)
+_FLAGS = (("is_preheating", 1), ("is_roasting", 2), ("is_roast_completed", 4))
+
+def is_sample(message):
+    return "time" in message
+
+def _flags(message):
+    return sum(bit for key, bit in _FLAGS if message.get(key))
+
+class TelemetryEncoder:
+    def __init__(self, format="json", batch=1):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format '{format}', expected one of {', '.join(FORMATS)}")
+        if format == "msgpack" and msgpack is None:
+            raise ValueError("msgpack format requires the msgpack package")
+        if batch < 1:
+            raise ValueError("batch must be at least 1")
+        self.format = format
+        self.batch = batch
+        self.pending = []
+        self._previous = {}
+        self._events = None
+
+    # Encode one hub message; returns the frames (str for text, bytes for
+    # binary) that are ready to send
+    def encode(self, message):
+        if not is_sample(message):
+            return self.flush() + [self._encode_control(message)]
+        frames = []
+        if self.format == "binary" and message.get("events") != self._events:
+            self._events = message.get("events")
+            frames.append(json.dumps({"events": self._events}, separators=(",", ":")))
+        if self.format == "json" and self.batch == 1:
+            return frames + [json.dumps(message, separators=(",", ":"))]
+        self.pending.append(message)
+        if len(self.pending) >= self.batch:
+            frames.extend(self.flush())
+        return frames
+
+    # Frames for any samples still waiting to fill a batch
+    def flush(self):
+        if not self.pending:
+            return []
+        samples, self.pending = self.pending, []
+        if self.format == "json":
+            return [json.dumps(samples, separators=(",", ":"))]
+        if self.format == "binary":
+            frames = []
+            for start in range(0, len(samples), _MAX_BATCH):
+                chunk = samples[start:start + _MAX_BATCH]
+                packed = [_BATCH_HEADER.pack(SAMPLES_FRAME, len(chunk))]
+                for sample in chunk:
+                    packed.append(_SAMPLE.pack(sample["seq"], *(sample[key] for key, _ in SAMPLE_FIELDS), _flags(sample)))
+                frames.append(b"".join(packed))
+            return frames
+        return [msgpack.packb([self._delta(sample) for sample in samples])]
+
+    # Frames catching a client up on buffered samples: `seqs` and `columns`
+    # as returned by SampleRing.since(), plus the roast's events so far
+    def encode_backfill(self, seqs, columns, events):
+        if not len(seqs):
+            return []
+        if self.format == "json":
+            backfill = {"seq": seqs.tolist(), **{name: values.tolist() for name, values in columns.items()}, "events": events}
+            return [json.dumps({"backfill": backfill}, separators=(",", ":"))]
+        samples = [
+            {"seq": seq, **{name: values[index].item() for name, values in columns.items()}, "events": events}
+            for index, seq in enumerate(seqs.tolist())
+        ]
+        frames = []
+        if self.format == "binary" and events != self._events:
+            self._events = events
+            frames.append(json.dumps({"events": events}, separators=(",", ":")))
+        self.pending = samples
+        return frames + self.flush()
+
+    def _delta(self, sample):
+        delta = {"n": sample["seq"]}
+        for key, short in SAMPLE_FIELDS:
+            if self._previous.get(short) != sample[key]:
+                delta[short] = self._previous[short] = sample[key]
+        for key, short in (("is_preheating", "p"), ("is_roasting", "s"), ("is_roast_completed", "c"), ("events", "v")):
+            if self._previous.get(short) != sample.get(key):
+                delta[short] = self._previous[short] = sample.get(key)
+        return delta
+
+    def _encode_control(self, message):
+        if self.format == "msgpack":
+            return msgpack.packb(message)
+        return json.dumps(message, separators=(",", ":"))
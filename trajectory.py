@@ -0,0 +1,82 @@
+import time
+import numpy as np
+from scheduler import scheduler
+
+#
+# Precomputed actuator trajectories
+#
+# Each curve is evaluated once, vectorized, into an int16 table of pulse
+# widths (quarter-microseconds) sampled every `resolution` seconds and
+# clamped to the allowed pulse range. Playback is then just an index lookup.
+#
+# A looping table leaves out the endpoint (the start of the next cycle), so
+# it has exactly duration / resolution samples and repeats every `duration`
+# seconds, in step with curves that wrap with np.mod(t, duration).
+#
+def precompute(curve, duration, resolution, min_pulse, max_pulse, endpoint=True):
+    times = np.arange(int(round(duration / resolution)) + (1 if endpoint else 0)) * resolution
+    pulses = np.clip(np.rint(curve(times)), min_pulse, max_pulse)
+    return pulses.astype(np.int16)
+
+class Track:
+    def __init__(self, channel, pulses, resolution, loop=True):
+        self.channel = channel
+        self.pulses = pulses
+        self.resolution = resolution
+        self.loop = loop
+
+    @property
+    def duration(self):
+        return len(self.pulses) * self.resolution
+
+    # Pulse width at `elapsed` seconds into playback
+    def at(self, elapsed):
+        index = int(elapsed / self.resolution)
+        if self.loop:
+            index %= len(self.pulses)
+        else:
+            index = min(index, len(self.pulses) - 1)
+        return int(self.pulses[index])
+
+#
+# Plays every track from one thread on the shared fixed-rate scheduler, so
+# ticks land on absolute deadlines and an overrun skips to the current tick
+# instead of bursting to catch up. Each tick queues the channels whose pulse
+# changed and sends them in one batched write.
+#
+class TrajectoryPlayer:
+    def __init__(self, servo, tick=0.01):
+        self.servo = servo
+        self.tick = tick
+        self.tracks = []
+        self.start_time = None
+        self._last_sent = {}
+        self._thread = None
+
+    def add_track(self, channel, curve, duration, resolution, min_pulse, max_pulse, loop=True):
+        track = Track(channel, precompute(curve, duration, resolution, min_pulse, max_pulse, endpoint=not loop), resolution, loop)
+        self.tracks.append(track)
+        return track
+
+    @property
+    def elapsed(self):
+        return 0.0 if self.start_time is None else time.monotonic() - self.start_time
+
+    @property
+    def late_ticks(self):
+        ticker = scheduler.tickers.get("trajectory-player")
+        return ticker.stats.overruns if ticker else 0
+
+    def step(self):
+        elapsed = self.elapsed
+        for track in self.tracks:
+            pulse = track.at(elapsed)
+            if self._last_sent.get(track.channel) != pulse:
+                self.servo.queueTarget(track.channel, pulse)
+                self._last_sent[track.channel] = pulse
+        self.servo.flushTargets()
+
+    def start(self):
+        if self._thread is None:
+            self.start_time = time.monotonic()
+            self._thread = scheduler.run_thread("trajectory-player", self.tick, self.step)
@@ -0,0 +1,201 @@
+import math
+import threading
+import time
+
+#
+#---------------------------
+# Virtual Maestro
+#---------------------------
+#
+# An in-process stand-in for the Maestro's serial port. It parses the Pololu
+# protocol (both the 0xAA <device> form and the compact form), models each
+# channel's speed and acceleration limits the way the firmware does, and
+# answers position, moving-state and error queries. maestro.Controller uses
+# it when the port is 'virtual' (or MAESTRO_PORT=virtual), so the servo stack
+# can be run, tested and benchmarked without hardware.
+#
+# Units follow the Maestro: positions in quarter-microseconds, speed in
+# quarter-microseconds per 10 ms, acceleration in quarter-microseconds per
+# 10 ms per 80 ms. Motion advances in 10 ms firmware ticks.
+#
+CHANNELS = 24
+TICK = 0.01
+
+# Command byte -> number of data bytes that follow (0x1F is variable)
+_COMMAND_LENGTHS = {
+    0x04: 3,  # set target
+    0x07: 3,  # set speed
+    0x09: 3,  # set acceleration
+    0x10: 1,  # get position
+    0x13: 0,  # get moving state
+    0x21: 0,  # get errors
+    0x22: 0,  # go home
+    0x24: 0,  # stop script
+    0x27: 1,  # restart script at subroutine
+    0x28: 3,  # restart script at subroutine with parameter
+    0x2e: 0,  # get script status
+}
+
+class Channel:
+    def __init__(self):
+        self.position = 0.0
+        self.velocity = 0.0
+        self.target = 0
+        self.speed = 0
+        self.accel = 0
+
+    def step(self):
+        distance = self.target - self.position
+        # A channel that was off, or has no limits, jumps straight to target
+        if self.position == 0 or (self.speed == 0 and self.accel == 0):
+            self.position = float(self.target)
+            self.velocity = 0.0
+            return
+        direction = math.copysign(1, distance)
+        max_speed = self.speed if self.speed else math.inf
+        if self.accel:
+            accel = self.accel / 8
+            # Fastest speed from which we can still stop at the target
+            stopping_speed = math.sqrt(2 * accel * abs(distance))
+            desired = direction * min(max_speed, stopping_speed)
+            change = max(-accel, min(accel, desired - self.velocity))
+            self.velocity += change
+        else:
+            self.velocity = direction * max_speed
+        if distance == 0 or (self.velocity * distance > 0 and abs(self.velocity) >= abs(distance)):
+            self.position = float(self.target)
+            self.velocity = 0.0
+        else:
+            self.position += self.velocity
+
+    @property
+    def moving(self):
+        return int(round(self.position)) != self.target
+
+class VirtualMaestro:
+    # baudrate, if given, delays each write by its transmission time
+    def __init__(self, device=0x0c, timeout=0.5, baudrate=None):
+        self.device = device
+        self.timeout = timeout
+        self.baudrate = baudrate
+        self.channels = [Channel() for _ in range(CHANNELS)]
+        self.commandCount = 0
+        self._input = bytearray()
+        self._output = bytearray()
+        self._replies = threading.Condition()
+        self._lastTick = time.monotonic()
+        self.is_open = True
+
+    # Run the firmware's 10 ms motion ticks up to now
+    def _advance(self):
+        now = time.monotonic()
+        ticks = int((now - self._lastTick) / TICK)
+        if ticks <= 0:
+            return
+        self._lastTick += ticks * TICK
+        for channel in self.channels:
+            if channel.moving:
+                for _ in range(ticks):
+                    channel.step()
+                    if not channel.moving:
+                        break
+
+    def write(self, data):
+        if self.baudrate:
+            time.sleep(len(data) * 10 / self.baudrate)
+        self._input += data
+        self._advance()
+        self._parse()
+        return len(data)
+
+    def read(self, size=1):
+        deadline = time.monotonic() + (self.timeout if self.timeout is not None else math.inf)
+        with self._replies:
+            while len(self._output) < size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._replies.wait(remaining)
+            reply = bytes(self._output[:size])
+            del self._output[:size]
+        return reply
+
+    @property
+    def in_waiting(self):
+        return len(self._output)
+
+    def reset_input_buffer(self):
+        with self._replies:
+            self._output.clear()
+
+    def close(self):
+        self.is_open = False
+
+    def _reply(self, data):
+        with self._replies:
+            self._output += data
+            self._replies.notify_all()
+
+    # Consume every complete command in the input buffer
+    def _parse(self):
+        buffer = self._input
+        while buffer:
+            if buffer[0] == 0xaa:
+                if len(buffer) < 3:
+                    return
+                if buffer[1] != self.device:
+                    # Addressed to another device on the line; skip its lead-in
+                    del buffer[:2]
+                    continue
+                start = 2
+                command = buffer[2]
+            elif buffer[0] & 0x80:
+                start = 0
+                command = buffer[0] & 0x7f
+            else:
+                # Stray data byte; the real device flags a serial error
+                del buffer[:1]
+                continue
+
+            if command == 0x1f:
+                if len(buffer) < start + 3:
+                    return
+                length = 2 + 2 * buffer[start + 1]
+            elif command in _COMMAND_LENGTHS:
+                length = _COMMAND_LENGTHS[command]
+            else:
+                del buffer[:start + 1]
+                continue
+            if len(buffer) < start + 1 + length:
+                return
+            data = bytes(buffer[start + 1:start + 1 + length])
+            del buffer[:start + 1 + length]
+            self.commandCount += 1
+            self._execute(command, data)
+
+    def _execute(self, command, data):
+        if command == 0x04:
+            self.channels[data[0]].target = data[1] | (data[2] << 7)
+        elif command == 0x1f:
+            first = data[1]
+            for i in range(data[0]):
+                self.channels[first + i].target = data[2 + 2 * i] | (data[3 + 2 * i] << 7)
+        elif command == 0x07:
+            self.channels[data[0]].speed = data[1] | (data[2] << 7)
+        elif command == 0x09:
+            self.channels[data[0]].accel = data[1] | (data[2] << 7)
+        elif command == 0x10:
+            position = int(round(self.channels[data[0]].position))
+            self._reply(bytes((position & 0xff, position >> 8)))
+        elif command == 0x13:
+            self._reply(bytes((int(any(channel.moving for channel in self.channels)),)))
+        elif command == 0x21:
+            self._reply(bytes((0, 0)))
+        elif command == 0x2e:
+            # Script not running
+            self._reply(bytes((1,)))
+        elif command == 0x22:
+            for channel in self.channels:
+                channel.target = 0
+                channel.position = 0.0
+                channel.velocity = 0.0